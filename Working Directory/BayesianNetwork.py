@@ -1,36 +1,219 @@
 import pgmpy.models
 import pgmpy.factors.discrete
+import functools
+
 import numpy as np
-import scipy.special
+import pandas as pd
 
 import DataGenerator
+from CompiledNetwork import CompiledNetwork
+from Cube import Cube
 
 
 class BayesianNetwork:
     def __init__(self):
         self._network = pgmpy.models.BayesianNetwork()
+        self._parametric = dict()
+        self._compiled = None
+
+    def simulate(self, n=10_000, seed=None, method="numpy", n_jobs=1, do=None, evidence=None):
+        """
+        Draws n samples from the network
+
+        :n: number of samples
+        :seed: seed for the random generator, if None, a random seed is used
+        :method: "numpy" uses the built-in vectorized ancestral sampler, "likelihood_weighting" uses the same
+                 sampler but fixes the evidence and weights every row by its likelihood, "pgmpy" falls back to
+                 pgmpy's simulate (rejection sampling for evidence)
+        :n_jobs: number of worker processes for the numpy sampler, -1 uses all cores. Results don't depend on n_jobs
+        :do: dict node -> value, samples under the intervention do(node=value)
+        :evidence: dict node -> value, samples conditioned on the evidence
+        :return: pandas DataFrame with one column per node, with likelihood weighting the weights are in "__weight__"
+        """
+        if method == "pgmpy":
+            return self.to_pgmpy().simulate(n, seed=seed, do=do, evidence=evidence)
+        if method == "numpy" and evidence:
+            raise ValueError("sampling with evidence requires method=\"likelihood_weighting\" or \"pgmpy\"")
+        if method not in ["numpy", "likelihood_weighting"]:
+            raise ValueError(f"unknown simulation method: {method}")
+
+        return self.compile().sample(n, seed=seed, n_jobs=n_jobs, do=do, evidence=evidence)
+
+    def simulate_iter(self, n=10_000, chunk_size=100_000, seed=None, method="numpy", do=None, evidence=None):
+        """
+        Draws n samples in chunks of at most chunk_size rows, only one chunk is kept in memory at a time.
+        Every chunk gets its own child seed of seed, so the stream is reproducible.
+
+        :n: total number of samples
+        :chunk_size: maximum number of rows per chunk
+        :seed: seed for the random generator, if None, a random seed is used
+        :method, do, evidence: see simulate
+        :return: generator of pandas DataFrames, indexed 0..n-1 over all chunks
+        """
+        no_chunks = -(-n // chunk_size)
+        for i, child in enumerate(np.random.SeedSequence(seed).spawn(no_chunks)):
+            start = i * chunk_size
+            chunk_seed = int(child.generate_state(1)[0]) if method == "pgmpy" else child
+            df = self.simulate(min(chunk_size, n - start), seed=chunk_seed, method=method, do=do, evidence=evidence)
+            df.index += start
+            yield df
+
+    def compile(self):
+        """
+        Freezes the network into a CompiledNetwork, the result is cached until the network changes
+
+        :return: CompiledNetwork
+        """
+        if self._compiled is None:
+            self._compiled = CompiledNetwork(self._network, self._parametric)
+        return self._compiled
+
+    def fit(self, data, structure=None, alpha=0.0):
+        """
+        Learns every cpd from data by (weighted) counting, one np.bincount per node
+
+        :data: Data object, its instance weights are used as row weights
+        :structure: list of edges (a, b), replaces the current graph. If None, the current graph is kept
+        :alpha: Dirichlet smoothing, pseudo count added to every cell of every cpd
+        :return: self
+        """
+        df = data.df(weight=False)
+        weights = np.asarray(data.weights(), dtype=float)
+        if structure is not None:
+            self._network = pgmpy.models.BayesianNetwork()
+            self._network.add_nodes_from(df.columns)
+            self._network.add_edges_from(structure)
+        self._parametric = dict()
+        self._compiled = None
+
+        # value codes per column: non-negative integers are used as is, anything else is factorized
+        codes, cardinality, state_names = dict(), dict(), dict()
+        for node in self._network.nodes():
+            column = df[node]
+            existing = self._network.get_cpds(node)
+            if pd.api.types.is_integer_dtype(column.dtype) and column.min() >= 0:
+                codes[node] = column.to_numpy()
+                cardinality[node] = int(column.max()) + 1
+                if existing is not None:
+                    cardinality[node] = max(cardinality[node], existing.variable_card)
+                state_names[node] = list(range(cardinality[node]))
+            else:
+                # categoricals (as simulated for named states) keep their categories
+                categorical = column.array if isinstance(column.dtype, pd.CategoricalDtype) else pd.Categorical(column)
+                codes[node] = categorical.codes
+                cardinality[node] = len(categorical.categories)
+                state_names[node] = list(categorical.categories)
+                if np.any(codes[node] < 0):
+                    raise ValueError(f"{node} has missing values, they can't be counted")
+
+        cpds = []
+        for node in self._network.nodes():
+            parents = self._network.get_parents(node)
+            card = cardinality[node]
+            flat = np.zeros(len(df), dtype=np.int64)
+            for parent in parents:
+                flat *= cardinality[parent]
+                flat += codes[parent]
+            configurations = int(np.prod([cardinality[parent] for parent in parents]))
+
+            counts = np.bincount(flat * card + codes[node], weights=weights, minlength=configurations * card)
+            counts = counts.reshape(configurations, card) + alpha
+            totals = counts.sum(axis=1, keepdims=True)
+            # unseen parent configurations get a uniform distribution
+            table = np.divide(counts, totals, out=np.full_like(counts, 1 / card), where=totals > 0)
+
+            cpds.append(pgmpy.factors.discrete.TabularCPD(node, card, table.T, evidence=parents or None,
+                                                          evidence_card=[cardinality[p] for p in parents] or None,
+                                                          state_names={v: state_names[v] for v in [node] + parents}))
+        existing = self._network.get_cpds()
+        if existing:
+            self._network.remove_cpds(*existing)
+        self._network.add_cpds(*cpds)
+        return self
 
-    def simulate(self, n=10_000, seed=None):
-        return self._network.simulate(n, seed=seed)
+    def query(self, variables, evidence=None):
+        """
+        Exact (conditional) distribution of variables, computed by variable elimination on the compiled network
+
+        :variables: list of nodes
+        :evidence: dict node -> value to condition on
+        :return: np.ndarray with one axis per variable (indexed by value code), in the order of variables
+        """
+        if evidence is None:
+            evidence = dict()
+        compiled = self.compile()
+        joint = compiled.marginal(list(variables) + list(evidence))
+        codes = compiled.codes_of(evidence)
+        table = joint[(Ellipsis,) + tuple(codes[compiled.nodes.index(node)] for node in evidence)]
+        return table / table.sum()
+
+    def fairness_metrics(self, protected, label, privileged=None, favorable=1):
+        """
+        Exact group fairness metrics of the network, the ground truth of what simulated data estimates
+
+        :protected: protected attribute
+        :label: label
+        :privileged: privileged value of protected, by default its highest value (as in Data)
+        :favorable: favorable value of label
+        :return: dict with the base rates, disparate impact and statistical parity (mean) difference
+        """
+        joint = self.cube([protected, label])
+        if privileged is None:
+            privileged = max(joint.values[0])
+        return joint.fairness_metrics(protected, label, privileged=privileged, favorable=favorable)
+
+    def cube(self, variables):
+        """
+        Exact joint distribution of variables as a Cube, the probabilities take the place of the counts
+
+        :variables: list of nodes
+        :return: Cube over variables, with the state names (or value codes) of every node as its values
+        """
+        compiled = self.compile()
+        values = []
+        for node in variables:
+            i = compiled.nodes.index(node)
+            states = compiled.state_names[i]
+            values.append(np.arange(compiled.cardinality[i]) if states is None else np.asarray(states))
+        return Cube(variables, values, compiled.marginal(list(variables)))
+
+    def to_pgmpy(self):
+        """
+        Returns the pgmpy model, parametric cpds are materialized into tabular cpds in a copy of the model.
+        Materializing is exponential in the number of parents of a parametric node.
+
+        :return: pgmpy BayesianNetwork
+        """
+        if not self._parametric:
+            return self._network
+        network = self._network.copy()
+        for node, cpd in self._parametric.items():
+            network.add_cpds(cpd.to_tabular(self._cardinalities(cpd.parents)))
+        return network
 
     def addEdge(self, a, b):
+        self._compiled = None
         self._network.add_edge(a, b)
 
     def addNode(self, a):
+        self._compiled = None
         self._network.add_node(a)
 
     def addCpd(self, a, parents, cpd):
+        self._compiled = None
+        self._parametric.pop(a, None)
         cpd_matrix = np.asarray(cpd)
         cpd = pgmpy.factors.discrete.TabularCPD(a, len(cpd), cpd_matrix, evidence=parents,
-                                                evidence_card=[len(self._network.get_cpds(parent).values) for parent
-                                                               in parents])
+                                                evidence_card=self._cardinalities(parents))
         self._network.add_cpds(cpd)
 
     def addProbability(self, a, p, size):
+        self._compiled = None
+        self._parametric.pop(a, None)
         if a in self._network.get_roots():
             try:
                 # discrete probability type
-                cpd = pgmpy.factors.discrete.TabularCPD(a, size, [[p.pmf(i)] for i in range(size)])
+                cpd = pgmpy.factors.discrete.TabularCPD(a, size, np.asarray(p.pmf(np.arange(size))).reshape(size, 1))
             except AttributeError:
                 # list type
                 cpd = pgmpy.factors.discrete.TabularCPD(a, size, [[i] for i in p] )
@@ -40,63 +223,83 @@ class BayesianNetwork:
             parents = self._network.get_parents(a)
             # ensure probability dictionary is complete
             for i in p:
-                if i not in parents and i is not a:
+                if i not in parents and i != a:
                     raise KeyError(f"{i} is not a parent of {a}")
             for i in parents:
                 if i not in p:
                     raise KeyError(f"no statistical function provided for parent: {i}")
 
-            cpd_matrix = []
-            for value in range(size-1):
-                # calculate probabilities for each value of outcome
-                matrices = []
-                for parent in parents:
+            cardinalities = self._cardinalities(parents)
+            # weight vector of every parent, evaluated once
+            weights = []
+            for parent, card in zip(parents, cardinalities):
+                try:
                     # divide by length to ensure i is within [0, 1]
-                    try:
-                        tmp = np.asarray([[p[parent].pdf(i / len(self._network.get_cpds(parent).values))]
-                                          for i in range(len(self._network.get_cpds(parent).values))])
-                    except AttributeError:
-                        tmp = np.asarray([[p[parent][i]]
-                                          for i in range(len(self._network.get_cpds(parent).values))])
-
-                    matrices.append(tmp)
-
-                matrix = None
-                # multiply all matrices with each other to get a layer of cpd
-                for m in matrices:
-                    if matrix is None:
-                        matrix = m
-                    else:
-                        matrix = np.matmul(matrix, m.T).flatten()
-                        matrix = matrix.reshape((len(matrix), 1))
-
-                # add weight of the specific outcome value
-                #if a in p:
-                #    matrix = matrix * p[a][(value+1*-1)]  # !! invert value
-
-                cpd_matrix.extend(matrix.T)
-
-            # use previously calculated matrix as val=1, and cols sum to 1
-            tmp = np.asarray(cpd_matrix)
-            cpd_matrix = list(1 - tmp)
-            cpd_matrix.extend(tmp)
-            cpd_matrix = np.asarray(cpd_matrix)
-
-            # ensure each column sums to 1
-            # using softmax
-            #cpd_matrix = scipy.special.softmax(cpd_matrix, axis=0)
-            # using normalization
-            #cpd_matrix /= np.asarray([cpd_matrix.T[i].sum() for i in range(len(cpd_matrix.T))])
-
-            #print(a)
-            print(cpd_matrix)
+                    weights.append(np.asarray(p[parent].pdf(np.arange(card) / card), dtype=float))
+                except AttributeError:
+                    weights.append(np.asarray(p[parent][:card], dtype=float))
+
+            # probability of a non-zero outcome for every parent configuration, first parent varies slowest
+            joint = functools.reduce(np.multiply.outer, weights).ravel()
+
+            # split the non-zero mass over the outcome values 1..size-1, using the outcome weights when provided
+            outcome = np.ones(size)
+            if a in p:
+                try:
+                    outcome = np.asarray(p[a].pmf(np.arange(size)), dtype=float)
+                except AttributeError:
+                    outcome = np.asarray(p[a], dtype=float)
+            outcome = outcome[1:] / outcome[1:].sum()
+
+            # use the joint weight as val>0, and cols sum to 1
+            cpd_matrix = np.empty((size, len(joint)))
+            cpd_matrix[0] = 1 - joint
+            cpd_matrix[1:] = np.outer(outcome, joint)
+
             cpd = pgmpy.factors.discrete.TabularCPD(a, size, cpd_matrix, evidence=parents,
-                                                    evidence_card=[len(self._network.get_cpds(parent).values) for parent
-                                                                   in parents])
+                                                    evidence_card=cardinalities)
             self._network.add_cpds(cpd)
 
+    def addParametricCpd(self, cpd):
+        """
+        Sets a parametric cpd (e.g. LogisticCPD or NoisyOrCPD) for cpd.variable, replacing any existing cpd.
+        The parents of the cpd must be the parents of the node in the network.
+        """
+        parents = self._network.get_parents(cpd.variable)
+        if set(parents) != set(cpd.parents) or len(parents) != len(cpd.parents):
+            raise KeyError(f"parents of the cpd don't match the parents of {cpd.variable}: {parents}")
+        self._compiled = None
+        existing = self._network.get_cpds(cpd.variable)
+        if existing is not None:
+            self._network.remove_cpds(existing)
+        self._parametric[cpd.variable] = cpd
+
     def check_model(self):
-        return self._network.check_model()
+        if not self._parametric:
+            return self._network.check_model()
+
+        # pgmpy can't check parametric cpds, check every node ourselves without materializing tables
+        for node in self._network.nodes():
+            parents = self._network.get_parents(node)
+            if node in self._parametric:
+                cpd = self._parametric[node]
+                cpd.check(self._cardinalities(cpd.parents))
+                continue
+            cpd = self._network.get_cpds(node)
+            if cpd is None:
+                raise ValueError(f"No CPD associated with {node}")
+            if set(cpd.variables[1:]) != set(parents):
+                raise ValueError(f"CPD associated with {node} doesn't have proper parents associated with it.")
+            if list(cpd.cardinality[1:]) != self._cardinalities(cpd.variables[1:]):
+                raise ValueError(f"Cardinality of the parents of {node} doesn't match the parent cpds")
+            if not cpd.is_valid_cpd():
+                raise ValueError(f"Sum or integral of conditional probabilities for node {node} is not equal to 1.")
+        return True
+
+    # internal functions
+    def _cardinalities(self, nodes):
+        return [self._parametric[node].variable_card if node in self._parametric
+                else self._network.get_cpds(node).variable_card for node in nodes]
 
 if __name__ == "__main__":
     bn = BayesianNetwork()
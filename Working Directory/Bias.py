@@ -1,10 +1,11 @@
 # Bias Generators
-from BiasGenerator.TemporalBiasGenerator import TemporalBiasGenerator
+from BiasGenerator.TemporalBiasGenerator import TemporalBiasGenerator, StreamingTemporalBiasGenerator
 from BiasGenerator.CauseEffectBiasGenerator import CauseEffectBiasGenerator
 from BiasGenerator.SamplingBiasGenerator import SamplingBiasGenerator, SelectionBiasGenerator
 from BiasGenerator.MeasurementBiasGenerator import MeasurementBiasGenerator
 from BiasGenerator.OmittedVariableBiasGenerator import OmittedVariableBiasGenerator
 from BiasGenerator.SimpsonsParadoxGenerator import SimpsonsParadoxGenerator
+from BiasGenerator.BiasPipeline import BiasPipeline
 
 # Data Generator
 from DataGenerator import DataGenerator
@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+
+from DataGenerator import BiasGenerator
+from BiasGenerator.MeasurementBiasGenerator import MeasurementBiasGenerator
+
+
+class BiasPipeline(BiasGenerator):
+    """
+    Applies a chain of bias generators, with the same result distribution as applying them one after the other.
+    Consecutive generators that only select rows are combined into one selection, consecutive measurement biases
+    into one generator with all their rules, so the data is copied and scanned once per combined stage.
+
+    Attributes
+    ----------
+    generators : list
+        the bias generators, in the order they are applied
+    timings : list
+        after apply, for every executed stage a tuple (names of the generators in it, seconds)
+
+    Methods
+    -------
+    apply(data)
+        Applies all generators on a given dataset, returns the biased set.
+    """
+    def __init__(self, generators):
+        super().__init__()
+        self.generators = list(generators)
+        self.timings = []
+
+    def apply(self, data):
+        self.timings = []
+        i = 0
+        while i < len(self.generators):
+            start = time.perf_counter()
+            stage = []
+
+            # row selections: every generator narrows the mask of the previous ones, the rows are selected once
+            mask = np.ones(len(data), dtype=bool)
+            while i < len(self.generators):
+                keep = self.generators[i].keep(data, mask)
+                if keep is None:
+                    break
+                mask = keep
+                stage.append(self.generators[i])
+                i += 1
+            if stage:
+                data = data.filter(mask)
+            elif isinstance(self.generators[i], MeasurementBiasGenerator):
+                stage = []
+                while i < len(self.generators) and isinstance(self.generators[i], MeasurementBiasGenerator):
+                    stage.append(self.generators[i])
+                    i += 1
+                data = self._merge(stage).apply(data)
+            else:
+                stage = [self.generators[i]]
+                i += 1
+                data = stage[0].apply(data)
+            self.timings.append(([type(g).__name__ for g in stage], time.perf_counter() - start))
+        return data
+
+    @staticmethod
+    def _merge(stage):
+        if len(stage) == 1:
+            return stage[0]
+        seeds = [g.seed for g in stage]
+        return MeasurementBiasGenerator(seed=None if None in seeds else np.random.SeedSequence(seeds),
+                                        rules=[rule for g in stage for rule in g._explicit_rules()])
@@ -1,5 +1,5 @@
 from DataGenerator import BiasGenerator
-import pgmpy.models
+from BayesianNetwork import BayesianNetwork
 
 
 class CauseEffectBiasGenerator(BiasGenerator):
@@ -22,8 +22,8 @@ class CauseEffectBiasGenerator(BiasGenerator):
         else:
             subset = data.df().sample(frac=self.P)
 
-        model = pgmpy.models.BayesianNetwork()
-        model.fit(data.df())
+        model = BayesianNetwork()
+        model.fit(data, structure=[])
         print(model.simulate(10))
 
         return data
@@ -6,6 +6,8 @@ import numpy as np
 class MeasurementBiasGenerator(BiasGenerator):
     """
     introduces a measurement bias on a given parameter, value pair.
+    Several rules can be applied at once, each measured column is copied once and every rule only touches
+    the rows it selects.
 
     Attributes
     ----------
@@ -14,21 +16,28 @@ class MeasurementBiasGenerator(BiasGenerator):
     pvalue : int
         bias is introduced w.r.t. this parameter, value pair
     measurement: str
-        the parameter we want to add a measurement error to
+        the parameter we want to add a measurement error to, or a list of parameters that all get the error
     bias_strength: float
         propability for a condidate datapoint to be altered
     weight: dict
         weight["measurement_error"]
             a statistical distribution that is added to the datapoint we alter, giving a new datapoint.
+            A list of probabilities is a discrete distribution over 0..len-1 that replaces the datapoint.
         weight["invalid_ratio"]
             a probability that a selected datapoint is set to a completely random value within its original domain
+    rules: list
+        list of (parameter, value, measurement) or (parameter, value, measurement, weight, bias_strength) tuples,
+        the rules are applied in order, rules without weight or bias_strength use those of the generator at the
+        time apply runs.
+        If None, the single rule (parameter, parameter_value, measurement) is applied
 
     Methods
     -------
     apply(data)
         Applies the bias on a given dataset, returns the biased set.
     """
-    def __init__(self, parameter, parameter_value, measurement, weight=None, bias_strength=0.3, seed=None):
+    def __init__(self, parameter=None, parameter_value=None, measurement=None, weight=None, bias_strength=0.3,
+                 seed=None, rules=None):
         super().__init__(seed)
         # Here bias strength indicates the probability in the rows containing the correct biased parameter
         # and value. That the measurement will be increased or decreased by one. Thus the lowest and highest
@@ -42,38 +51,60 @@ class MeasurementBiasGenerator(BiasGenerator):
             weight = dict()
         self.weight = weight
 
-        # if weight["measurement_error"] is a list, convert to scipy stats object
-        self._discrete = False
-        if "measurement_error" in self.weight:
-            if type(self.weight["measurement_error"]) is list:
-                self._discrete = True
-                self.weight["measurement_error"] = scipy.stats.rv_discrete(values=(range(len(self.weight["measurement_error"])), self.weight["measurement_error"]))
+        self.rules = rules
 
-    def apply(self, data):
-        data = data.copy() # ensure original object isn't changed
+    def _explicit_rules(self):
+        # (parameter, value, measurement, weight, bias_strength) with the current defaults of this generator, read
+        # at apply time so changes to the attributes after construction count
+        rules = [(self.parameter, self.pvalue, self.measurement)] if self.rules is None else self.rules
+        return [(rule[0], rule[1], rule[2], rule[3] if len(rule) > 3 and rule[3] is not None else self.weight,
+                 rule[4] if len(rule) > 4 and rule[4] is not None else self.bias_strength) for rule in rules]
+
+    @staticmethod
+    def _rule(parameter, value, measurement, weight, bias_strength):
+        # (parameter, value, measurements, error, discrete, invalid_ratio, bias_strength)
+        error = weight.get("measurement_error", scipy.stats.norm(0, 1))
+        # if measurement_error is a list, convert to scipy stats object
+        discrete = type(error) is list
+        if discrete:
+            error = scipy.stats.rv_discrete(values=(range(len(error)), error))
+        measurements = [measurement] if isinstance(measurement, str) else list(measurement)
+        return parameter, value, measurements, error, discrete, weight.get("invalid_ratio", 0.01), bias_strength
 
-        np.random.seed(self.seed)
+    def apply(self, data):
+        rng = np.random.default_rng(self.seed)
+        df = data.df()
 
-        # ensure weight dict is complete, fill with default values where empty
-        if "invalid_ratio" not in self.weight:
-            self.weight["invalid_ratio"] = 0.01
-        if "measurement_error" not in self.weight:
-            self.weight["measurement_error"] = scipy.stats.norm(0, 1)
+        # the measured columns are copied once, compact unsigned columns can't hold negative intermediate values,
+        # so these are computed as int64 and get their type back at the end
+        columns, domains = dict(), dict()
+        rules = [self._rule(*rule) for rule in self._explicit_rules()]
+        for parameter, value, measurements, error, discrete, invalid_ratio, bias_strength in rules:
+            # select the measurements that encountered extra error (row positions), same selection for all columns.
+            # A parameter measured by an earlier rule is selected on its measured values
+            mask = columns[parameter] == value if parameter in columns else data.group_mask(parameter, value)
+            candidates = np.flatnonzero(mask)
+            rows = rng.choice(candidates, size=round(bias_strength * len(candidates)), replace=False)
+            invalid = rng.choice(rows, size=round(invalid_ratio * len(rows)), replace=False)
 
-        values = data.df(weight=True)[self.measurement].unique()
+            for m in measurements:
+                if m not in columns:
+                    dtype = df[m].dtype
+                    columns[m] = df[m].to_numpy().astype(np.int64 if np.issubdtype(dtype, np.unsignedinteger) else dtype)
+                    domains[m] = (columns[m].min(), columns[m].max())
+                column = columns[m]
+                low, high = domains[m]
+                # add measurement error
+                if discrete:
+                    column[rows] = error.rvs(size=len(rows), random_state=rng)
+                else:
+                    column[rows] += np.round(error.rvs(size=len(rows), random_state=rng)).astype(int)
+                # if smaller, set to min value, if larger, set to max value, only the altered rows can be out of range
+                column[rows] = np.clip(column[rows], low, high)
+                # add invalid ratio to selected measurements
+                column[invalid] = rng.integers(int(low), int(high) + 1, len(invalid))
 
-        # select the measurements that encountered extra error
-        tmp = data.df(weight=True).loc[(data.df(weight=True)[self.parameter] == self.pvalue)].sample(frac=self.bias_strength, random_state=self.seed)
-        # add measurement error
-        if self._discrete:
-            data.df(weight=True).loc[tmp.index.values, self.measurement] = self.weight["measurement_error"].rvs(size=len(tmp), random_state=self.seed)
-        else:
-            data.df(weight=True).loc[tmp.index.values, self.measurement] += np.round(self.weight["measurement_error"].rvs(size=len(tmp), random_state=self.seed)).astype(int)
-        # if smaller, set to min value
-        data.df(weight=True).loc[(data.df(weight=True)[self.measurement] < min(values)), self.measurement] = min(values)
-        # if larger, set to max value
-        data.df(weight=True).loc[(data.df(weight=True)[self.measurement] > max(values)), self.measurement] = max(values)
-        # add invalid ratio to selected measurements
-        tmp = tmp.sample(frac=self.weight["invalid_ratio"], random_state=self.seed)
-        data.df(weight=True).loc[tmp.index.values, self.measurement] = np.random.randint(min(values), max(values) + 1, len(tmp))
+        data = data.copy()  # ensure original object isn't changed
+        for m, column in columns.items():
+            data.set_column(m, column.astype(df[m].dtype))
         return data
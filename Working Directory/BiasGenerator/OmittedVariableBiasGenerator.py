@@ -1,3 +1,5 @@
+import numpy as np
+
 from DataGenerator import BiasGenerator
 
 
@@ -24,18 +26,22 @@ class OmittedVariableBiasGenerator(BiasGenerator):
         self.pvalue = parameter_value
 
     def apply(self, data):
-        data = data.copy() # ensure original object isn't changed
+        keep = self.keep(data, np.ones(len(data), dtype=bool))
+        if keep is not None:
+            return data.filter(keep)
+        # the column is removed, either no value is provided or it is the final value of this column
+        return data.copy().remove_variable(self.parameter_to_omit)  # ensure original object isn't changed
 
+    def keep(self, data, mask):
         # if no value is provided, remove entire column
         if self.pvalue is None:
-            return data.remove_variable(self.parameter_to_omit)
+            return None
         # if value is provided, remove rows that contain said value
-        values = data.df(weight=True)[self.parameter_to_omit].unique()
+        column = data.df()[self.parameter_to_omit].to_numpy()
+        values = np.unique(column[mask])
         if len(values) == 0:
-            return data
+            return mask
         # if it is the final value of this column, remove the column instead of all the rows
         if len(values) == 1 and values[0] == self.pvalue:
-            return data.remove_variable(self.parameter_to_omit)
-        else:
-            data.df(weight=True).drop(data.df(weight=True).loc[(data.df(weight=True)[self.parameter_to_omit] == self.pvalue)].index, inplace=True)
-            return data
+            return None
+        return mask & (column != self.pvalue)
@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 
 from DataGenerator import BiasGenerator
 
@@ -8,7 +9,11 @@ class SamplingBiasGenerator(BiasGenerator):
     The sampling bias generator will remove rows based on four parameters. First it will only select
     rows for which parameter == pvalue, of these rows bias_strength determines how many rows are dropped.
     This dropping is weighted by the weight dictionary. Thus for each row where parameter == pvalue there
-    is a probability of (weight / total weight) * bias_strength for this row to be dropped.
+    is a probability of (weight / maximum weight) * bias_strength for this row to be dropped.
+    With weights for several attributes the probabilities of the attributes are multiplied.
+
+    All drop probabilities are looked up in one pass and a single random mask removes the rows, so every
+    row is judged on the original data.
 
     Attributes
     ----------
@@ -19,67 +24,76 @@ class SamplingBiasGenerator(BiasGenerator):
     pvalue : int
         we introduce bais with respect to this value of parameter
     weight : dict
-        this dictionary contains a weight for each potential value of the labels in the dataset
-        if weights are not provided these are generated based on the value. This weight will indicate
-        how likely it is for a row with a certain value to be removed.
+        this dictionary contains a weight for each potential value of the labels in the dataset,
+        example: {label1: {val1: weight, val2: weight}, label2 : {..}}. Values without a weight are never dropped.
+        A tuple of attributes weights their values jointly: {(label1, label2): {(val1, val2): weight, ..}}.
+        If no weights are provided, every candidate row has probability bias_strength to be dropped.
+    exact : bool
+        if True, exactly round(probability * count) rows are dropped from every combination of weighted values
+        (as pandas sample(frac) does), otherwise every row is dropped independently with its probability
 
     Methods
     -------
     apply(data)
         Applies the bias on a given dataset, returns the biased set.
     """
-    def __init__(self, parameter, parameter_value, weight=None, bias_strength=0.3, seed=None):
+    def __init__(self, parameter, parameter_value, weight=None, bias_strength=0.3, seed=None, exact=False):
         super().__init__(seed)
 
         self.bias_strength = bias_strength  # Probability for items of selected group to be removed
         self.parameter = parameter  # parameter to remove values for
         self.pvalue = parameter_value  # value of parameter to remove values for
         if weight is None:  # optional weight dictionary
-            weight = dict()  # example: {label1: {val1: weight, val2: weight}, label2 : {..}
-        self.weight = weight  # unfilled weights use value as their weight, if this value is 0, the lowest value above zero is halved and used instead
+            weight = dict()
+        self.weight = weight
+        self.exact = exact
 
     def apply(self, data):
-        # ensure we don't change the object
-        data = data.copy()
+        if not self.exact:
+            return data.filter(self.keep(data, np.ones(len(data), dtype=bool)))
+        probability, cell = self._probabilities(data)
+
+        # rows are ranked within their cell by a random priority, the lowest ranks are dropped
+        rng = np.random.default_rng(self.seed)
+        cells, cell, count = np.unique(cell, return_inverse=True, return_counts=True)
+        drop = np.round(np.bincount(cell, weights=probability, minlength=len(cells)))
+        order = np.lexsort((rng.random(len(data)), cell))
+        start = np.concatenate([[0], np.cumsum(count)[:-1]])
+        rank = np.empty(len(data), dtype=np.int64)
+        rank[order] = np.arange(len(data)) - start[cell[order]]
+        return data.filter(rank >= drop[cell])
+
+    def keep(self, data, mask):
+        # exact counts depend on the other rows
+        if self.exact:
+            return None
+        probability, _ = self._probabilities(data)
+        return mask & (np.random.default_rng(self.seed).random(len(data)) >= probability)
+
+    def _probabilities(self, data):
+        df = data.df()
+        candidates = data.group_mask(self.parameter, self.pvalue)
+        probability = np.where(candidates, float(self.bias_strength), 0.0)
+        # cell: candidate or not and the combination of weighted values of a row, all rows of a cell have the same
+        # drop probability, exact mode drops a fixed share of every cell
+        cell = candidates.astype(np.int64)
+        for attributes, weights in self.weight.items():
+            attributes = attributes if isinstance(attributes, tuple) else (attributes,)
+            codes, table = _lookup(df, attributes, weights)
+            probability *= table[codes]
+            cell = cell * len(table) + codes
+        return probability, cell
+
 
-        # ensure that a fully functional weight dictionary is present. Fill where empty
-        max_w = np.NINF
-        total_weight = dict()
-        if len(self.weight) == 0:
-            label_values = data.label_values()
-            for key in label_values:
-                total_weight[key] = 0
-                if key not in self.weight:
-                    self.weight[key] = dict()
-                for value in label_values[key]:
-                    if value not in self.weight[key]:
-                        self.weight[key][value] = 1
-                    total_weight[key] += self.weight[key][value]
-        elif len(self.weight) == 1:
-            for key in self.weight:
-                if key not in total_weight:
-                    total_weight[key] = 0
-                    for value in self.weight[key]:
-                        total_weight[key] += self.weight[key][value]
-                        if self.weight[key][value] > max_w:
-                            max_w = self.weight[key][value]
-        else:
-            raise NotImplementedError("Can only introduce sample bias with respect to one attribute at a time")
+def _lookup(df, attributes, weights):
+    # encodes the value combination of attributes per row, table[code] is the weight relative to the largest weight
+    codes, uniques = pd.factorize(pd.MultiIndex.from_arrays([df[a] for a in attributes])
+                                  if len(attributes) > 1 else df[attributes[0]])
+    largest = max(weights.values()) or 1
+    table = np.zeros(len(uniques) + 1)  # code -1 (missing values) maps to the last entry, weight 0
+    for i, value in enumerate(uniques):
+        table[i] = weights.get(value, 0) / largest
+    return np.where(codes < 0, len(uniques), codes), table
 
-        #print(self.weight, total_weight)
-        # drop rows based on weight
-        for key in self.weight:
-            for value in self.weight[key]:
-                # fraction is multiplied by bias_strength to determine the probability for an item to be dropped
-                # normalize by dividing by maximum
-                #fraction = float(self.weight[key][value]) / float(total_weight[key])
-                fraction = float(self.weight[key][value]) / max_w
-                # potential flaw: as these happen after one another the later values use already modified data
 
-                f = self.bias_strength * fraction
-                #print(f)
-                data.df(weight=True).drop(
-                    data.df(weight=True).loc[(data.df(weight=True)[self.parameter] == self.pvalue) & (data.df(weight=True)[key] == value)].sample(
-                        frac=f, random_state=self.seed).index, inplace=True)
-        return data
 SelectionBiasGenerator = SamplingBiasGenerator
@@ -1,6 +1,6 @@
 import copy
 
-from Data import Data
+from Data import concat
 from DataGenerator import DataGenerator
 import scipy.stats
 import numpy as np
@@ -42,9 +42,8 @@ class SimpsonsParadoxGenerator:
         for ind, val in enumerate(self._generators):
             j = int(self.groups[ind]["weight"] / self._total_weight * n)
             datas.append(val.simulate(j, seed=seed))
-            datas[-1].df(weight=True)[self.group_label] = self.groups[ind]["name"]
+            datas[-1].set_column(self.group_label, self.groups[ind]["name"])
         # combine objects into one big object
-        import pandas as pd
-        data = Data(pd.concat(d.df(weight=True) for d in datas), self._prot, self._lab)
+        data = concat(datas)
 
         return data
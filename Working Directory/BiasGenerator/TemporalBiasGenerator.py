@@ -1,5 +1,6 @@
 from DataGenerator import BiasGenerator
 import numpy as np
+import pandas as pd
 
 class TemporalBiasGenerator(BiasGenerator):
     """
@@ -9,7 +10,8 @@ class TemporalBiasGenerator(BiasGenerator):
     this causation between the hype and primary distributions we ensure that the outcome of the hype distribution
     is used as a parameter for the primary distribution. Thus to create a datapoint at time t we use the following
     formula: primary(hype(t)). By default this time t is the index of the item, however this can also be a column
-    named "time"
+    named "time", holding numbers, datetimes or timedeltas, that is scaled to [0, 1].
+    The hype distribution is evaluated once per distinct time.
 
     Attributes
     ----------
@@ -21,13 +23,16 @@ class TemporalBiasGenerator(BiasGenerator):
         The hype distribution denotes the temporal parameter for the primary distribution
     use_index_as_time: bool
         determins if you use a column "time" as time, or the index
+    time_range: tuple
+        (start, end) times that are scaled to 0 and 1, by default the first and last time of the data
 
     Methods
     -------
     apply(data)
         Applies the bias on a given dataset, returns the biased set.
     """
-    def __init__(self, parameter, primary_distribution, hype_distribution, use_index_as_time=True, domain=None):
+    def __init__(self, parameter, primary_distribution, hype_distribution, use_index_as_time=True, domain=None,
+                 time_range=None):
         super().__init__()
         # Hype distribution interval is [0, 1] by default.
         # Primary distribution uses the output of hype distribution as a parameter
@@ -37,27 +42,83 @@ class TemporalBiasGenerator(BiasGenerator):
         self.hdis = hype_distribution
         self.index_time = use_index_as_time
         self.domain = domain
+        self.time_range = time_range
 
     def apply(self, data):
         data = data.copy() # ensure original object isn't changed
 
         if self.index_time:
-            data.df(weight=True)[self.parameter] = self.pdis(self.hdis(range(len(data.df(weight=True)))))
+            data.set_column(self.parameter, self.pdis(self.hdis(self._time(len(data)))))
         else:
-            if "time" not in data.df(weight=True):
-                data.df(weight=True)["time"] = range(len(data.df(weight=True)))
-            scaled_time = data.df(weight=True)["time"].to_list()
-            try:
-                scaled_time = np.asarray([d.timedelta for d in scaled_time])
-            except Exception:
-                pass
-            scaled_time = (scaled_time - np.min(scaled_time)) / np.ptp(scaled_time)
-            data.df(weight=True)[self.parameter] = self.pdis(self.hdis(scaled_time))
+            if "time" not in data.df():
+                data.set_column("time", self._time(len(data)))
+            time = _numeric_time(data.df()["time"])
+            low, high = (time.min(), time.max()) if self.time_range is None else \
+                _numeric_time(pd.Series(list(self.time_range)))
+            # hype once per distinct time, broadcast back to the rows
+            times, inverse = np.unique(time, return_inverse=True)
+            scaled_time = (times - low) / ((high - low) or 1)
+            data.set_column(self.parameter, self.pdis(np.asarray(self.hdis(scaled_time))[inverse]))
 
         if self.domain is not None:
-            # if smaller, set to min value
-            data.df(weight=True).loc[(data.df(weight=True)[self.parameter] < min(self.domain)), self.parameter] = min(self.domain)
-            # if larger, set to max value
-            data.df(weight=True).loc[(data.df(weight=True)[self.parameter] > max(self.domain)), self.parameter] = max(self.domain)
-            #
+            # if smaller, set to min value, if larger, set to max value
+            data.set_column(self.parameter, np.clip(data.df()[self.parameter], min(self.domain), max(self.domain)))
         return data
+
+    def _time(self, n):
+        # time of the rows of a dataset without time column
+        return np.arange(n)
+
+
+class StreamingTemporalBiasGenerator(TemporalBiasGenerator):
+    """
+    Temporal bias for data that comes in chunks (e.g. DataGenerator.simulate_iter): every apply continues the time
+    of the previous one, so the hype runs over the whole stream instead of restarting in every chunk.
+    By default the "time" column is used: chunks without one get the position of their rows in the stream, which
+    is scaled to [0, 1] with the length of the stream (n) or a time_range. With use_index_as_time=True the hype
+    distribution gets the unscaled positions in the stream and n and time_range are not used.
+
+    Attributes
+    ----------
+    n : int
+        number of rows of the whole stream, sets time_range to (0, n - 1) when no time_range is given
+    start : int
+        time of the first row of the next chunk
+
+    Methods
+    -------
+    apply(data)
+        Applies the bias on the next chunk, returns the biased chunk.
+    reset()
+        Starts the time at 0 again.
+    """
+    def __init__(self, parameter, primary_distribution, hype_distribution, use_index_as_time=False, domain=None,
+                 time_range=None, n=None):
+        if time_range is None and n is not None:
+            time_range = (0, n - 1)
+        super().__init__(parameter, primary_distribution, hype_distribution, use_index_as_time=use_index_as_time,
+                         domain=domain, time_range=time_range)
+        self.n = n
+        self.start = 0
+
+    def reset(self):
+        self.start = 0
+
+    def _time(self, n):
+        time = np.arange(self.start, self.start + n)
+        self.start += n
+        return time
+
+
+def _numeric_time(time):
+    # numbers, datetimes or timedeltas (also as python objects) as numbers, datetimes in nanoseconds since the epoch
+    kind = pd.api.types.infer_dtype(time, skipna=True)
+    if kind in ("datetime", "datetime64", "date"):
+        time = pd.to_datetime(time, utc=True)
+    elif kind in ("timedelta", "timedelta64"):
+        time = pd.to_timedelta(time)
+    if isinstance(time.dtype, pd.DatetimeTZDtype):
+        time = time.dt.tz_localize(None)
+    if pd.api.types.is_datetime64_dtype(time) or pd.api.types.is_timedelta64_dtype(time):
+        return time.to_numpy().astype(f"{time.dtype.kind}8[ns]").view(np.int64)
+    return time.to_numpy(dtype=float)
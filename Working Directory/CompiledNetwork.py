@@ -0,0 +1,359 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import networkx
+
+from ParametricCPD import NoisyOrCPD
+
+# rows are drawn in blocks of this size, each with its own child seed, so results don't depend on n_jobs
+BLOCK_SIZE = 65_536
+# exact inference refuses factors with more cells than this (float64, 128 MiB)
+MAX_FACTOR_SIZE = 2 ** 24
+# and queries that split into more variable eliminations than this (two per wide noisy-OR node)
+MAX_TERMS = 2 ** 10
+
+
+class CompiledNetwork:
+    """
+    A frozen, array based representation of a BayesianNetwork. All structural information needed for
+    sampling is derived once from the pgmpy model and stored in contiguous, read-only numpy arrays, so
+    repeated simulations don't pay for it again.
+
+    Attributes
+    ----------
+    nodes : tuple
+        the nodes of the network in topological order
+    cardinality : np.ndarray
+        cardinality of every node, aligned with nodes
+    parents : tuple
+        for every node an array with the positions (in nodes) of its parents, in pgmpy evidence order
+    strides : tuple
+        for every node the strides that turn parent values into a flat parent-configuration index
+    tables : tuple
+        for every node the cumulative cpd table, shape (#parent configurations, cardinality),
+        or the ParametricCPD for nodes with a parametric cpd
+    state_names : tuple
+        for every node the state names, or None when the states are 0..cardinality-1
+    dtype : np.dtype
+        the smallest unsigned integer type that holds the values of every node
+
+    Methods
+    -------
+    sample(n, seed)
+        Draws n rows, returns a DataFrame.
+    marginal(variables)
+        Exact joint distribution of variables by variable elimination.
+    """
+    def __init__(self, network, parametric=None):
+        if parametric is None:
+            parametric = dict()
+        nodes = tuple(networkx.topological_sort(network))
+        position = {node: i for i, node in enumerate(nodes)}
+
+        cardinality = np.empty(len(nodes), dtype=np.int64)
+        parents, strides, tables, state_names = [], [], [], []
+        for i, node in enumerate(nodes):
+            if node in parametric:
+                cpd = parametric[node]
+                cardinality[i] = cpd.variable_card
+                parents.append(self._freeze(np.asarray([position[p] for p in cpd.parents], dtype=np.int64)))
+                strides.append(None)
+                tables.append(cpd)
+                state_names.append(None)
+                continue
+
+            cpd = network.get_cpds(node)
+            if cpd is None:
+                raise ValueError(f"no cpd defined for node: {node}")
+            cardinality[i] = cpd.variable_card
+
+            evidence_card = np.asarray(cpd.cardinality[1:], dtype=np.int64)
+            # first parent varies slowest (pgmpy column order)
+            stride = np.ones(len(evidence_card), dtype=np.int64)
+            if len(evidence_card) > 1:
+                stride[:-1] = np.cumprod(evidence_card[::-1])[-2::-1]
+            parents.append(self._freeze(np.asarray([position[p] for p in cpd.variables[1:]], dtype=np.int64)))
+            strides.append(self._freeze(stride))
+
+            cumulative = np.cumsum(cpd.get_values().T, axis=1)
+            cumulative[:, -1] = 1.0
+            tables.append(self._freeze(np.ascontiguousarray(cumulative)))
+
+            states = list(cpd.state_names[node])
+            state_names.append(None if states == list(range(cpd.variable_card)) else tuple(states))
+
+        self.nodes = nodes
+        self.cardinality = self._freeze(cardinality)
+        self.parents = tuple(parents)
+        self.strides = tuple(strides)
+        self.tables = tuple(tables)
+        self.state_names = tuple(state_names)
+        self.dtype = np.min_scalar_type(max(1, int(cardinality.max(initial=1)) - 1))
+
+        # inference caches, node factors and marginals are reused by every query on this network
+        self._factors = dict()
+        self._marginals = dict()
+
+    @staticmethod
+    def _freeze(array):
+        array.setflags(write=False)
+        return array
+
+    def sample(self, n, seed=None, n_jobs=1, do=None, evidence=None):
+        """
+        Vectorized ancestral sampling, every node is drawn for all rows at once.
+
+        :n: number of rows
+        :seed: seed or numpy SeedSequence, if None, a random seed is used
+        :n_jobs: number of worker processes, -1 uses all cores. The result for a given seed is the same for any n_jobs
+        :do: dict node -> value, these nodes are set to value and their incoming edges are cut
+        :evidence: dict node -> value, these nodes are set to value and every row is weighted by the
+                   likelihood of the evidence (likelihood weighting), the weights are the "__weight__" column
+        :return: pandas DataFrame with one column per node
+        """
+        codes, weights = self.sample_codes(n, seed=seed, n_jobs=n_jobs, do=do, evidence=evidence)
+        df = self._frame(codes)
+        if weights is not None:
+            df["__weight__"] = weights
+        return df
+
+    def sample_codes(self, n, seed=None, n_jobs=1, do=None, evidence=None):
+        """
+        Same as sample, but returns the raw value codes as an array of shape (#nodes, n) and type dtype,
+        together with the likelihood weights (None without evidence)
+        """
+        do = self.codes_of(do)
+        evidence = self.codes_of(evidence)
+        if set(do) & set(evidence):
+            raise ValueError("a node can't be both intervened on and observed")
+
+        seeds = _seed_sequence(seed).spawn(-(-n // BLOCK_SIZE))
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+        n_jobs = min(n_jobs, len(seeds))
+
+        if n_jobs <= 1:
+            codes = np.empty((len(self.nodes), n), dtype=self.dtype)
+            weights = np.ones(n) if evidence else None
+            for block, block_seed in enumerate(seeds):
+                self._sample_block(codes, weights, block, block_seed, do, evidence)
+            return codes, weights
+
+        # workers write their blocks straight into one preallocated shared buffer: codes, then weights
+        shape = (len(self.nodes), n)
+        offset = -(-n * len(self.nodes) * self.dtype.itemsize // 8) * 8
+        shm = shared_memory.SharedMemory(create=True, size=max(1, offset + (8 * n if evidence else 0)))
+        try:
+            codes, weights = _buffers(shm, self.dtype, shape, offset, evidence)
+            if weights is not None:
+                weights[:] = 1
+            bounds = np.linspace(0, len(seeds), n_jobs + 1).astype(int)
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                     initargs=(self, shm.name, shape, offset, do, evidence)) as pool:
+                tasks = [pool.submit(_sample_blocks, start, seeds[start:end])
+                         for start, end in zip(bounds[:-1], bounds[1:])]
+                for task in tasks:
+                    task.result()
+            return codes.copy(), None if weights is None else weights.copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def codes_of(self, assignment):
+        """
+        Converts a dict node -> value (state name) to a dict node position -> value code
+        """
+        codes = dict()
+        for node, value in (assignment or dict()).items():
+            i = self.nodes.index(node)
+            if self.state_names[i] is not None:
+                value = self.state_names[i].index(value)
+            if not 0 <= value < self.cardinality[i]:
+                raise ValueError(f"{value} is not a value of {node}")
+            codes[i] = int(value)
+        return codes
+
+    def _sample_block(self, codes, weights, block, seed, do, evidence):
+        rows = codes[:, block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE]
+        n = rows.shape[1]
+        rng = np.random.default_rng(seed)
+        for i in range(len(self.nodes)):
+            # u is always drawn, so rows under do() share their random numbers with the observational rows
+            u = rng.random(n)
+            value = rows[i]
+            value[:] = 0
+            if i in do:
+                value[:] = do[i]
+                continue
+
+            if self.strides[i] is None:
+                # parametric cpd, evaluated per row, the table is never materialized
+                cumulative = np.cumsum(self.tables[i].probabilities(rows[self.parents[i]]), axis=0).T
+                flat = slice(None)
+            else:
+                flat = np.zeros(n, dtype=np.int64)
+                for parent, stride in zip(self.parents[i], self.strides[i]):
+                    flat += np.multiply(rows[parent], stride, dtype=np.int64)
+                cumulative = self.tables[i]
+
+            if i in evidence:
+                # likelihood weighting: set the observed value, weight by its probability given the parents
+                k = evidence[i]
+                value[:] = k
+                likelihood = cumulative[flat, k] - (cumulative[flat, k - 1] if k > 0 else 0)
+                weights[block * BLOCK_SIZE:block * BLOCK_SIZE + n] *= likelihood
+                continue
+
+            # inverse cdf lookup: the drawn value is the number of cumulative bounds below u
+            for k in range(self.cardinality[i] - 1):
+                value += u >= cumulative[flat, k]
+
+    def marginal(self, variables):
+        """
+        Exact joint distribution of variables, computed by variable elimination over their ancestors.
+        Results are cached, so queries on the same variables (in any order) are only computed once.
+        Parametric cpds are materialized, which is exponential in their number of parents. Noisy-OR cpds
+        too wide for that are split into two terms that factorize over the parents, logistic ones can't be
+        and raise a ValueError, as does any other factor larger than MAX_FACTOR_SIZE.
+
+        :variables: list of nodes
+        :return: np.ndarray with one axis per variable (indexed by value code), in the order of variables
+        """
+        positions = [self.nodes.index(v) for v in variables]
+        key = frozenset(positions)
+        if key not in self._marginals:
+            self._marginals[key] = self._eliminate(sorted(key))
+        order, table = self._marginals[key]
+        return np.transpose(table, [order.index(p) for p in positions])
+
+    def _eliminate(self, keep):
+        # nodes that aren't ancestors of the kept variables sum out to 1 and are skipped
+        relevant = set(keep)
+        stack = list(keep)
+        while stack:
+            for parent in self.parents[stack.pop()]:
+                if parent not in relevant:
+                    relevant.add(parent)
+                    stack.append(parent)
+
+        # every node gives one or more terms (lists of factors) that sum to its cpd, the joint is the sum of the
+        # eliminations of every combination of terms
+        terms = [self._terms(i) for i in sorted(relevant)]
+        combinations = np.prod([len(t) for t in terms], dtype=float)
+        if combinations > MAX_TERMS:
+            raise ValueError(f"exact inference needs {combinations:.0f} variable eliminations, too many wide "
+                             f"noisy-OR nodes")
+        table = None
+        for combination in itertools.product(*terms):
+            result = self._eliminate_factors([f for term in combination for f in term], relevant - set(keep), keep)
+            table = result if table is None else table + result
+        return tuple(keep), table
+
+    def _eliminate_factors(self, factors, remaining, keep):
+        remaining = set(remaining)
+        while remaining:
+            # greedy order: eliminate the variable that creates the smallest factor
+            def size(var):
+                scope = set().union(*(f[0] for f in factors if var in f[0]))
+                return np.prod([self.cardinality[v] for v in scope], dtype=float)
+            var = min(remaining, key=size)
+            if size(var) > MAX_FACTOR_SIZE:
+                raise ValueError(f"exact inference needs a factor of {size(var):.0f} cells to eliminate "
+                                 f"{self.nodes[var]}, more than MAX_FACTOR_SIZE")
+            remaining.remove(var)
+
+            involved = [f for f in factors if var in f[0]]
+            factors = [f for f in factors if var not in f[0]]
+            scope = tuple(sorted(set().union(*(f[0] for f in involved)) - {var}))
+            factors.append((scope, _product(involved, scope)))
+        return _product(factors, tuple(keep))
+
+    def _terms(self, i):
+        # the cpd of node i as a list of terms, each a list of factors (variables, table)
+        if i not in self._factors:
+            parent_cards = [self.cardinality[p] for p in self.parents[i]]
+            size = np.prod(parent_cards, dtype=float) * self.cardinality[i]
+            cpd = self.tables[i]
+            if self.strides[i] is not None:
+                table = np.diff(cpd, axis=1, prepend=0.0)
+            elif size <= MAX_FACTOR_SIZE:
+                configurations = np.indices(parent_cards).reshape(len(parent_cards), -1)
+                table = cpd.probabilities(configurations).T
+            elif isinstance(cpd, NoisyOrCPD):
+                self._factors[i] = self._noisy_or_terms(i)
+                return self._factors[i]
+            else:
+                raise ValueError(f"exact inference would materialize the cpd of {self.nodes[i]} with {size:.0f} "
+                                 f"cells ({len(parent_cards)} parents), more than MAX_FACTOR_SIZE")
+            self._factors[i] = [[(tuple(self.parents[i]) + (i,), table.reshape(parent_cards + [self.cardinality[i]]))]]
+        return self._factors[i]
+
+    def _noisy_or_terms(self, i):
+        # P(i = 0 | x) = (1 - leak) * prod_j g_j(x_j), so the cpd is [i = 1] + ([i = 0] - [i = 1]) * P(i = 0 | x),
+        # two terms that are products of factors over one variable each
+        cpd = self.tables[i]
+        first = [((i,), np.array([0.0, 1.0]))]
+        second = [((i,), np.array([1.0, -1.0]) * (1 - cpd.leak))]
+        for parent, activation in zip(self.parents[i], cpd.activation):
+            g = np.full(self.cardinality[parent], 1 - activation)
+            g[0] = 1.0
+            second.append(((parent,), g))
+        return [first, second]
+
+    def _frame(self, codes):
+        # every column gets the smallest unsigned type for its cardinality, named states become categoricals
+        columns = dict()
+        for i, node in enumerate(self.nodes):
+            if self.state_names[i] is None:
+                columns[node] = codes[i].astype(np.min_scalar_type(max(1, self.cardinality[i] - 1)), copy=False)
+            else:
+                columns[node] = pd.Categorical.from_codes(codes[i], categories=self.state_names[i])
+        return pd.DataFrame(columns, copy=False)
+
+
+def _product(factors, scope):
+    # multiplies factors (variables, table) and sums out everything not in scope, einsum labels are local
+    labels = {v: k for k, v in enumerate(set(scope).union(*(f[0] for f in factors)))}
+    # factors without variables (summed out parts) are folded into one, einsum takes at most 32 operands
+    scalar = np.prod([table for variables, table in factors if not variables])
+    operands = [scalar, []]
+    for variables, table in factors:
+        if not variables:
+            continue
+        operands.extend([table, [labels[v] for v in variables]])
+    return np.einsum(*operands, [labels[v] for v in scope])
+
+
+def _seed_sequence(seed):
+    # copy SeedSequences, spawning mutates them and would make repeated calls differ
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+    return np.random.SeedSequence(seed)
+
+
+def _buffers(shm, dtype, shape, offset, evidence):
+    codes = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    weights = np.ndarray(shape[1], dtype=np.float64, buffer=shm.buf, offset=offset) if evidence else None
+    return codes, weights
+
+
+# worker process state for CompiledNetwork.sample_codes
+_worker = dict()
+
+
+def _init_worker(network, name, shape, offset, do, evidence):
+    _worker["network"] = network
+    _worker["shm"] = shared_memory.SharedMemory(name=name)
+    _worker["codes"], _worker["weights"] = _buffers(_worker["shm"], network.dtype, shape, offset, evidence)
+    _worker["do"] = do
+    _worker["evidence"] = evidence
+
+
+def _sample_blocks(start, seeds):
+    for block, seed in enumerate(seeds, start=start):
+        _worker["network"]._sample_block(_worker["codes"], _worker["weights"], block, seed,
+                                         _worker["do"], _worker["evidence"])
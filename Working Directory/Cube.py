@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+
+class Cube:
+    """
+    Weighted joint counts of a set of discrete columns: counts[i, j, ..] is the total weight of the rows where
+    columns[0] == values[0][i], columns[1] == values[1][j], ... . It is built in one pass over the rows, every
+    marginal, rate or group summary after that is derived from the counts in O(#cells) instead of O(#rows).
+
+    Attributes
+    ----------
+    columns : tuple
+        the columns of the cube, one axis per column
+    values : tuple
+        for every column the sorted array of its values, aligned with the axis
+    counts : np.ndarray
+        the weighted counts, one axis per column
+
+    Methods
+    -------
+    append(df, weights)
+        Adds rows to the counts, new values extend the axes.
+    marginal(columns)
+        The cube over a subset of the columns.
+    rate(column, value, given)
+        Rate of column == value for every combination of the given columns.
+    summary(by, column)
+        Weighted mean and count of column per combination of the by columns, as a DataFrame.
+    fairness_metrics(protected, label, privileged, favorable)
+        Base rates, disparate impact and statistical parity difference.
+    """
+    def __init__(self, columns, values, counts):
+        self.columns = tuple(columns)
+        self.values = tuple(np.asarray(v) for v in values)
+        self.counts = np.asarray(counts, dtype=float)
+
+    @staticmethod
+    def from_frame(df, columns, weights=None):
+        """
+        :df: pandas DataFrame
+        :columns: discrete columns of df
+        :weights: weight of every row, if None, every row counts as 1
+        :return: Cube
+        """
+        cube = Cube(columns, [np.empty(0, dtype=df[c].dtype if df[c].dtype != "category" else object)
+                              for c in columns], np.zeros([0] * len(columns)))
+        return cube.append(df, weights)
+
+    def copy(self):
+        return Cube(self.columns, self.values, self.counts.copy())
+
+    def append(self, df, weights=None):
+        """
+        Adds the rows of df to the counts (in place), for example the chunks of a streaming simulation
+
+        :df: pandas DataFrame with the columns of the cube
+        :weights: weight of every row, if None, every row counts as 1
+        :return: self
+        """
+        codes, values = [], []
+        for i, c in enumerate(self.columns):
+            # hash based factorization, O(n), missing values get code -1
+            code, uniques = pd.factorize(df[c], sort=True)
+            merged = np.union1d(self.values[i], np.asarray(uniques))
+            codes.append(np.where(code >= 0, np.searchsorted(merged, np.asarray(uniques))[code], -1))
+            values.append(merged)
+
+        if any(len(v) != len(old) for v, old in zip(values, self.values)):
+            # new values: the existing counts are moved to the positions of their values on the extended axes
+            counts = np.zeros([len(v) for v in values])
+            counts[np.ix_(*[np.searchsorted(v, old) for v, old in zip(values, self.values)])] = self.counts
+            self.counts, self.values = counts, tuple(values)
+
+        keep = np.all([code >= 0 for code in codes], axis=0) if codes else np.ones(len(df), dtype=bool)
+        flat = np.ravel_multi_index([code[keep] for code in codes], self.counts.shape)
+        weights = None if weights is None else np.asarray(weights, dtype=float)[keep]
+        self.counts += np.bincount(flat, weights=weights, minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+
+    def marginal(self, columns):
+        """
+        :columns: columns of the cube
+        :return: Cube over columns (in that order), the other columns are summed out
+        """
+        axes = [self.columns.index(c) for c in columns]
+        other = tuple(i for i in range(len(self.columns)) if i not in axes)
+        counts = self.counts.sum(axis=other)
+        # sum keeps the remaining axes in cube order
+        order = sorted(axes)
+        counts = np.transpose(counts, [order.index(a) for a in axes])
+        return Cube(columns, [self.values[a] for a in axes], counts)
+
+    def rate(self, column, value=1, given=()):
+        """
+        :column: column of the cube
+        :value: value of column
+        :given: columns to condition on
+        :return: np.ndarray with one axis per given column, the rate of column == value in every cell (nan when
+                 a cell is empty)
+        """
+        joint = self.marginal(list(given) + [column])
+        counts = joint.counts
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return counts[..., self._position(column, value)] / counts.sum(axis=-1)
+
+    def summary(self, by, column):
+        """
+        Same as df.groupby(by)[column].agg(["mean", "count"]) with weights, empty groups are left out
+
+        :by: columns to group by
+        :column: numeric column to summarize
+        :return: DataFrame with the by columns, "mean" and "count"
+        """
+        joint = self.marginal(list(by) + [column]).counts
+        count = joint.sum(axis=-1)
+        total = joint @ self.values[self.columns.index(column)].astype(float)
+        observed = np.nonzero(count)
+        df = pd.DataFrame({c: self.values[self.columns.index(c)][i] for c, i in zip(by, observed)})
+        df["mean"] = total[observed] / count[observed]
+        df["count"] = count[observed]
+        return df
+
+    def fairness_metrics(self, protected, label, privileged=None, favorable=1):
+        """
+        :protected: protected attribute
+        :label: label
+        :privileged: privileged value of protected, by default its highest value (as in Data)
+        :favorable: favorable value of label
+        :return: dict with the base rates, disparate impact and statistical parity (mean) difference
+        """
+        joint = self.marginal([protected, label]).counts
+        joint = joint / joint.sum()
+        if privileged is None:
+            privileged = self.values[self.columns.index(protected)][-1]
+        privileged = self._position(protected, privileged)
+        favorable = self._position(label, favorable)
+
+        unprivileged = np.arange(len(joint)) != privileged
+        privileged_rate = joint[privileged, favorable] / joint[privileged].sum()
+        unprivileged_rate = joint[unprivileged, favorable].sum() / joint[unprivileged].sum()
+        return {"base_rate": joint[:, favorable].sum(),
+                "privileged_base_rate": privileged_rate,
+                "unprivileged_base_rate": unprivileged_rate,
+                "disparate_impact": unprivileged_rate / privileged_rate,
+                "statistical_parity_difference": unprivileged_rate - privileged_rate,
+                "mean_difference": unprivileged_rate - privileged_rate}
+
+    def _position(self, column, value):
+        values = self.values[self.columns.index(column)]
+        position = np.flatnonzero(values == value)
+        if len(position) == 0:
+            raise ValueError(f"{value} is not a value of {column}")
+        return position[0]
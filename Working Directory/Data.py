@@ -1,82 +1,405 @@
 import aif360.metrics
 import numpy as np
+import pandas as pd
+import scipy.stats
 import aif360.datasets
 from sklearn.model_selection import train_test_split
 import tqdm
 import copy
+import json
+import os
+import weakref
+
+from Cube import Cube
 
 class Data:
-    def __init__(self, df, protected_attributes, labels, weights=None, scores=''):
-        self._df = df
-        self._y = labels
+    def __init__(self, df, protected_attributes, labels, weights=None, scores='', trusted=False, groups=None):
+        # columnar input (dict of numpy arrays or a pyarrow Table) is wrapped in a DataFrame without copying
+        if isinstance(df, dict):
+            df = pd.DataFrame(df, copy=False)
+        elif hasattr(df, "to_pandas"):
+            df = df.to_pandas(split_blocks=True)
+        # instance weights are kept next to the frame, a "__weight__" column in df is used when no weights are given
+        if "__weight__" in df:
+            if weights is None:
+                weights = df["__weight__"].to_numpy()
+            df = df.drop("__weight__", axis=1)
+        self._frame = df
+        self._rows = None  # row selection in _frame, None selects all rows
+        self._y = list(labels)
         self._scores = scores
-        self._p = protected_attributes
-
-        self._privileged_groups = dict()
-        self._unprivileged_groups = dict()
-        for p in self._p:
-            self._privileged_groups[p] = [np.max(self._df[p])]
-            self._unprivileged_groups[p] = list(set(self._df[p].unique()) - set(self._privileged_groups[p]))
+        self._p = list(protected_attributes)
+        # trusted data (produced by this library) isn't re-validated when converted to aif360
+        self._trusted = trusted
+        # aif360 objects are cached against the version, every mutation increments it
+        self._version = 0
+        self._cache = dict()
+        # feature matrices per dtype, only invalidated when a feature column (or the row selection) changes
+        self._matrices = dict()
 
-        self._isBinary = self._setBinary()
+        # group structure, (privileged, unprivileged) dicts attribute -> values, computed from the rows when not given.
+        # Derived objects (copies, filters, splits) share it instead of recomputing it
+        if groups is None:
+            groups = _groups({p: self._df[p].unique() for p in self._p})
+        self._privileged_groups = {p: list(v) for p, v in groups[0].items()}
+        self._unprivileged_groups = {p: list(v) for p, v in groups[1].items()}
+        self._group_rows = None  # per row group codes, see _group_codes
+        self._binary = None  # whether all labels are binary, determined on first use
 
         if weights is None:
-            weights = [1] * len(self._df)
-        self._df.loc[:, "__weight__"] = np.asarray(weights)
+            weights = np.ones(len(self._df))
+        self._w = np.asarray(weights, dtype=float)
 
     # Basic
     def X(self):
-        return self.df(weight=False).drop(self._y, axis=1)
+        return self._df.drop(self._y, axis=1)
 
     def y(self):
-        return self.df(weight=False).loc[:, self._y].values.ravel()
+        """
+           The labels as a read-only array. With one label this is a view on the label column without copying,
+           the column is shared with copies and filters of this object, so it can't be written through this view.
+           Several labels are interleaved per row into a new (also read-only) array.
+           """
+        if len(self._y) == 1:
+            return _read_only(self._df[self._y[0]].to_numpy())
+        return _read_only(self._df[self._y].to_numpy().ravel())
 
     def weights(self):
-        return self.df(weight=True).loc[:, "__weight__"].values.ravel()
+        """
+           The instance weights as a read-only view on the weight array (no copy), which is shared with copies
+           and filters of this object
+           """
+        return _read_only(self._w)
+
+    def matrix(self, dtype=np.float64):
+        """
+           The features (the columns of X()) as one C-contiguous matrix, which estimators accept without converting
+           it again. The matrix is cached per dtype until a feature column changes, it is read-only.
+
+           :dtype: type of the matrix, e.g. np.float32 for tree based models, which convert to float32
+           :return: np.ndarray of shape (len(self), #features)
+           """
+        dtype = np.dtype(dtype)
+        if dtype not in self._matrices:
+            columns = [c for c in self._frame.columns if c not in self._y]
+            matrix = np.empty((len(self), len(columns)), dtype=dtype)
+            for j, c in enumerate(columns):
+                column = self._frame[c]
+                # categoricals are stored as their codes
+                if isinstance(column.dtype, pd.CategoricalDtype):
+                    column = column.cat.codes
+                column = column.to_numpy()
+                matrix[:, j] = column if self._rows is None else column[self._rows]
+            matrix.setflags(write=False)
+            self._matrices[dtype] = matrix
+        return self._matrices[dtype]
 
     def set_labels(self, new_labels):
-        self.df(weight=True).loc[:, self._y] = new_labels.reshape(len(new_labels), 1)
+        new_labels = new_labels.reshape(len(new_labels), -1)
+        for i, y in enumerate(self._y):
+            self.set_column(y, new_labels[:, i % new_labels.shape[1]], rows=slice(None))
+        self._modified(features=False)
         return self
 
     def set_scores(self, new_scores, name="scores"):
-        self.df(weight=True).loc[:, name] = new_scores
+        self.set_column(name, new_scores)
         self._scores = name
+        self._modified()
+        return self
+
+    def set_column(self, name, values, rows=None):
+        """
+           Sets (a part of) a column. Only this column is copied, other columns stay shared with related Data objects
+
+           :name: column name
+           :values: new values
+           :rows: if None, the column is replaced by values. Otherwise values are written to these rows (positions
+                  or boolean mask) of a copy of the column, keeping its type unless the values don't fit in it
+           :return: self
+           """
+        if rows is None or name not in self._df:
+            self._df[name] = values
+        else:
+            column = self._df[name].to_numpy(copy=True)
+            values = np.asarray(values)
+            if not _fits(values, column.dtype):
+                column = column.astype(np.result_type(column, values))
+            column[rows] = values
+            self._df[name] = column
+        if name in self._y:
+            self._binary = None
+        if name in self._p:
+            self._group_rows = None
+        self._modified(features=name not in self._y)
         return self
 
     def df(self, weight=False):
+        """
+           The data as a DataFrame. Without weights this is the frame itself (no copy), with weights a new frame
+           with an extra "__weight__" column is assembled, changes to that frame don't change this object.
+           The columns of the frame are shared with the copies, filters and splits of this object (and the object
+           it was derived from): writing into them in place (df().loc[..] = .., df()[name].to_numpy()[..] = ..)
+           changes all of these. Change columns through set_column, which copies the column first and invalidates
+           the cached aif360 objects, or take df().copy() to modify the frame freely.
+           """
         if weight:
-            return self._df
-        return self._df.drop('__weight__', axis=1)
+            frame = self._df.copy(deep=False)
+            frame["__weight__"] = self._w
+            return frame
+        return self._df
+
+    @property
+    def _df(self):
+        # row selections are materialized on first access
+        if self._rows is not None:
+            self._frame = self._frame.take(self._rows)
+            self._rows = None
+        return self._frame
+
+    @_df.setter
+    def _df(self, df):
+        self._frame = df
+        self._rows = None
+        self._modified()
+
+    def _modified(self, features=True):
+        self._version += 1
+        self._cache = dict()
+        if features:
+            self._matrices = dict()
 
     def copy(self):
-        return copy.deepcopy(self)
+        """
+           Copy-on-write copy: the copy shares the column buffers (and row selection) of this object. Columns are
+           only copied when they are modified, modify columns through set_column (or replace them with df()[name] = ..)
+           and never write into them in place.
+
+           :return: Data
+           """
+        d = copy.copy(self)
+        d._cache = dict(self._cache)
+        d._matrices = dict(self._matrices)
+        d._frame = self._frame.copy(deep=False)
+        d._y = list(self._y)
+        d._p = list(self._p)
+        d._privileged_groups = copy.deepcopy(self._privileged_groups)
+        d._unprivileged_groups = copy.deepcopy(self._unprivileged_groups)
+        return d
 
     def __len__(self):
-        return len(self.df(weight=False))
+        return len(self._frame) if self._rows is None else len(self._rows)
 
     # aif
     def metrics(self, other=None):
+        """
+           aif360 metric object, cached until this object (or other) changes
+
+           :other: Data with predictions, if provided a ClassificationMetric is returned
+           :return: BinaryLabelDatasetMetric or ClassificationMetric
+           """
         if other:
-            return aif360.metrics.ClassificationMetric(self.aif(), other.aif(),
-                                                       privileged_groups=[self._privileged_groups],
-                                                       unprivileged_groups=[self._unprivileged_groups])
+            return self._cached("classification_metrics", lambda: aif360.metrics.ClassificationMetric(
+                self.aif(), other.aif(),
+                privileged_groups=[self._privileged_groups],
+                unprivileged_groups=[self._unprivileged_groups]), version=_version_of(other))
         else:
-            return aif360.metrics.BinaryLabelDatasetMetric(self.aif(),
-                                                       privileged_groups=[self._privileged_groups],
-                                                       unprivileged_groups=[self._unprivileged_groups])
+            return self._cached("metrics", lambda: aif360.metrics.BinaryLabelDatasetMetric(
+                self.aif(),
+                privileged_groups=[self._privileged_groups],
+                unprivileged_groups=[self._unprivileged_groups]))
 
     def aif(self):
+        """
+           The data as aif360 BinaryLabelDataset, cached until this object changes. Don't modify the result,
+           copy it first.
+           """
         if self._isBinary:
-            rval = aif360.datasets.BinaryLabelDataset(df=self._df,
-                                                      label_names=self._y,
-                                                      protected_attribute_names=self._p,
-                                                      instance_weights_name="__weight__",
-                                                      scores_names=self._scores)
-            rval.validate_dataset()
-            return rval
+            return self._cached("aif", self._aif)
         else:
             raise NotImplemented("support for non binary label dataset")
 
+    def _aif(self):
+        rval = aif360.datasets.BinaryLabelDataset(df=self.df(weight=True),
+                                                  label_names=self._y,
+                                                  protected_attribute_names=self._p,
+                                                  instance_weights_name="__weight__",
+                                                  scores_names=self._scores)
+        if not self._trusted:
+            rval.validate_dataset()
+        return rval
+
+    def fairness_report(self, other=None, metrics=None):
+        """
+           Computes fairness metrics without aif360: every row is encoded as one integer (group, label, prediction)
+           and a single weighted bincount gives all the counts the metrics are derived from. The values are the
+           same as those of the aif360 object returned by metrics(other).
+
+           :other: Data with predictions (the labels of other), required for the classification metrics
+           :metrics: names of the metrics to compute (aif360 method names), if None, every applicable metric.
+                     For metrics that can be conditioned on a group, the values for both groups are included as
+                     "privileged_<name>" and "unprivileged_<name>"
+           :return: dict metric name -> value
+           """
+        available = DATASET_METRICS + (CLASSIFICATION_METRICS if other is not None else ())
+        if metrics is None:
+            metrics = available
+        for name in metrics:
+            if name not in available:
+                raise ValueError(f"unknown metric: {name}" if other is not None or name not in CLASSIFICATION_METRICS
+                                 else f"{name} needs predictions (other)")
+
+        # counts[group, label, prediction], group 0: unprivileged, 1: privileged, 2: neither
+        # labels and predictions 0: unfavorable, 1: favorable, 2: other values
+        counts, predicted = self._cached("counts" if other is None else "classification_counts",
+                                         lambda: self._counts(other), version=_version_of(other))
+        groups = {"": counts.sum(axis=0), "privileged_": counts[1], "unprivileged_": counts[0]}
+        predicted = {"": predicted.sum(axis=0), "privileged_": predicted[1], "unprivileged_": predicted[0]}
+
+        differences = CLASSIFICATION_DIFFERENCES if other is not None else DATASET_DIFFERENCES
+        rval = dict()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = {prefix: _measures(groups[prefix], predicted[prefix]) for prefix in groups}
+            for name in metrics:
+                if name in differences:
+                    rval[name] = differences[name](values["unprivileged_"], values["privileged_"])
+                else:
+                    for prefix in groups:
+                        rval[prefix + name] = values[prefix][name]
+        return rval
+
+    def consistency(self, n_neighbors=5, method="exact", weighted=False, sample_size=10_000, confidence=0.95,
+                    seed=None, n_jobs=-1):
+        """
+           Individual fairness metric of aif360 (Zemel et al.): 1 - mean_i |y_i - mean of the labels of the
+           n_neighbors nearest rows of i|, the neighbours of a row include the row itself.
+
+           :n_neighbors: number of neighbours
+           :method: "exact": ball tree kNN over all rows (as aif360) on n_jobs cores.
+                    "sample": kNN over all rows for a random sample of sample_size rows, returns the estimate with
+                    a confidence interval.
+                    "hash": for discrete features, identical rows are grouped (on their bytes) and the kNN runs over the
+                    distinct rows, ties between identical rows are averaged
+           :weighted: if True, the mean over the rows is weighted by the instance weights (aif360 doesn't weight)
+           :sample_size: number of rows for method "sample"
+           :confidence: confidence level of the interval for method "sample"
+           :seed: seed of the sample for method "sample"
+           :n_jobs: number of cores for the neighbour search, -1 uses all cores
+           :return: float, for method "sample" (estimate, (lower, upper))
+           """
+        from sklearn.neighbors import NearestNeighbors
+        # the cached feature matrix instead of the copy X() makes, without the scores column
+        features = self.matrix()
+        columns = [c for c in self._frame.columns if c not in self._y]
+        if self._scores in columns:
+            features = np.delete(features, columns.index(self._scores), axis=1)
+        y = self.y().astype(float)
+        weights = self._w if weighted else np.ones(len(y))
+
+        if method == "hash":
+            # distinct rows with their row count and label sum, the neighbours of a row are taken from its own
+            # duplicates first, then from the nearest distinct rows, until n_neighbors rows are reached
+            keys = np.ascontiguousarray(features).view(np.dtype((np.void, features.itemsize * features.shape[1])))
+            _, first, inverse = np.unique(keys.ravel(), return_index=True, return_inverse=True)
+            count = np.bincount(inverse).astype(float)
+            rate = np.bincount(inverse, weights=y) / count
+            k = min(n_neighbors, len(first))
+            indices = np.arange(len(first))[:, None]
+            if k > 1:
+                nbrs = NearestNeighbors(n_neighbors=k - 1, n_jobs=n_jobs).fit(features[first])
+                indices = np.hstack([indices, nbrs.kneighbors()[1]])
+            taken = np.minimum(count[indices], np.maximum(n_neighbors - np.cumsum(count[indices], axis=1)
+                                                          + count[indices], 0))
+            neighbours = (taken * rate[indices]).sum(axis=1) / taken.sum(axis=1)
+            return 1 - np.average(np.abs(y - neighbours[inverse]), weights=weights)
+
+        X = features
+        nbrs = NearestNeighbors(n_neighbors=n_neighbors, algorithm="ball_tree", n_jobs=n_jobs).fit(X)
+        if method == "exact":
+            _, indices = nbrs.kneighbors(X)
+            return 1 - np.average(np.abs(y - y[indices].mean(axis=1)), weights=weights)
+        if method != "sample":
+            raise ValueError(f"unknown method: {method}")
+
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(y), size=min(sample_size, len(y)), replace=False)
+        _, indices = nbrs.kneighbors(X[rows])
+        terms = np.abs(y[rows] - y[indices].mean(axis=1))
+        w = weights[rows] / weights[rows].sum()
+        estimate = 1 - np.sum(w * terms)
+        # normal interval with finite population correction, n_eff accounts for unequal weights
+        n_eff = 1 / np.sum(w ** 2)
+        variance = np.sum(w * (terms - np.sum(w * terms)) ** 2) / max(n_eff - 1, 1) * (1 - len(rows) / len(y))
+        z = scipy.stats.norm.ppf(0.5 + confidence / 2)
+        return estimate, (estimate - z * np.sqrt(variance), estimate + z * np.sqrt(variance))
+
+    def cube(self, columns):
+        """
+           Weighted joint counts of discrete columns, built in one pass and cached until this object changes.
+           Marginals, rates and group summaries of these columns are derived from it without scanning the rows.
+           Copy the cube before appending rows to it
+
+           :columns: list of discrete columns
+           :return: Cube
+           """
+        return self._cached(("cube", tuple(columns)), lambda: Cube.from_frame(self._df, columns, self._w))
+
+    def _counts(self, other):
+        if len(self._y) != 1:
+            raise ValueError("fairness metrics need a single label")
+        group = self._group_codes()
+        flat = group * 9 + _outcome_codes(self.y()) * 3
+        if other is not None:
+            flat += _outcome_codes(other.y())
+        counts = np.bincount(flat, weights=self._w, minlength=27).reshape(3, 3, 3)
+        # aif360 counts predictions with the weights of the classified data
+        predicted = counts if other is None or other._w is self._w else \
+            np.bincount(flat, weights=other._w, minlength=27).reshape(3, 3, 3)
+        return counts, predicted
+
+    def group_mask(self, attribute, value):
+        """
+           Boolean mask of the rows where attribute == value, read from the group codes when attribute is the
+           protected attribute and value one of its groups
+           """
+        if self._p == [attribute]:
+            if [value] == self._privileged_groups[attribute]:
+                return self._group_codes() == 1
+            if [value] == self._unprivileged_groups[attribute]:
+                return self._group_codes() == 0
+        return (self._df[attribute] == value).to_numpy()
+
+    def _group_codes(self):
+        # 1 where every protected attribute has its privileged value, 0 where every one has an unprivileged value,
+        # 2 otherwise (only possible with several protected attributes). Computed once, row selections select
+        # from it, it is only recomputed when a protected attribute changes
+        if self._group_rows is None:
+            privileged = np.ones(len(self), dtype=bool)
+            unprivileged = np.ones(len(self), dtype=bool)
+            for p in self._p:
+                column = self._df[p]
+                if isinstance(column.dtype, pd.CategoricalDtype):
+                    # look up the categories once, missing values (code -1) select the appended False
+                    codes = column.cat.codes.to_numpy()
+                    categories = column.cat.categories.to_numpy()
+                    privileged &= np.append(np.isin(categories, self._privileged_groups[p]), False)[codes]
+                    unprivileged &= np.append(np.isin(categories, self._unprivileged_groups[p]), False)[codes]
+                    continue
+                column = column.to_numpy()
+                privileged &= np.isin(column, self._privileged_groups[p])
+                unprivileged &= np.isin(column, self._unprivileged_groups[p])
+            codes = np.full(len(self), 2, dtype=np.uint8)
+            codes[unprivileged] = 0
+            codes[privileged] = 1
+            codes.setflags(write=False)
+            self._group_rows = codes
+        return self._group_rows
+
+    def _cached(self, key, build, version=()):
+        version = (self._version,) + version
+        if key not in self._cache or self._cache[key][0] != version:
+            self._cache[key] = (version, build())
+        return self._cache[key][1]
+
     def privilegedGroups(self):
         return self._privileged_groups
 
@@ -90,12 +413,13 @@ class Data:
     def label_values(self):
         rval = dict()
         for y in self._y:
-            rval[y] = self.df(weight=False)[y].unique()
+            rval[y] = self._df[y].unique()
         return rval
 
     def remove_variable(self, variable):
         # remove a column
-        self.df(weight=True).drop(variable, axis=1, inplace=True)
+        self._df.drop(variable, axis=1, inplace=True)
+        self._modified(features=variable not in self._y)
         # ensure this column is also removed from all other locations
         if variable in self._y:
             self._y.remove(variable)
@@ -103,19 +427,72 @@ class Data:
             self._p.remove(variable)
             self._privileged_groups.pop(variable)
             self._unprivileged_groups.pop(variable)
-        self._isBinary = self._setBinary()
+            self._group_rows = None
+        self._binary = None
         return self
 
     # data frame altering functions
     def drop(self, indices, inplace=False):
-        return self._df.drop(indices, inplace=inplace)
+        if not inplace:
+            return self.df(weight=True).drop(indices)
+        keep = np.ones(len(self), dtype=bool)
+        keep[self._positions(indices)] = False
+        self._df = self._df[keep]
+        self._w = self._w[keep]
+        self._select_groups(keep)
 
     def filter(self, f):
+        """
+           Selects rows, the result shares the columns of this object until it is modified
+
+           :f: boolean mask over the rows, or index labels
+           :return: Data
+           """
+        f = np.asarray(f)
+        if f.dtype != bool:
+            f = self._positions(f)
+        return self._take(f)
+
+    def _take(self, f):
+        # view on the rows f (positions or mask), sharing columns, groups and the row selection of this object
+        positions = np.arange(len(self._frame)) if self._rows is None else self._rows
         d = self.copy()
-        d._df = self._df.loc[f]
+        d._rows = positions[f]
+        d._w = self._w[f]
+        d._select_groups(f)
+        # a selection of binary labels is binary, otherwise it has to be checked again
+        if not d._binary:
+            d._binary = None
+        d._modified()
         return d
 
+    def _select_groups(self, f):
+        if self._group_rows is not None:
+            self._group_rows = self._group_rows[f]
+            self._group_rows.setflags(write=False)
+
+    def _index(self):
+        return self._frame.index if self._rows is None else self._frame.index[self._rows]
+
+    def _positions(self, labels):
+        # row positions of index labels, missing labels raise a KeyError as .loc and DataFrame.drop do
+        labels = np.atleast_1d(labels)
+        positions = self._index().get_indexer_for(labels)
+        if np.any(positions < 0):
+            raise KeyError(f"{list(labels[positions < 0])} not in index")
+        return positions
+
     # internal functions
+    @property
+    def _isBinary(self):
+        if self._binary is None:
+            self._binary = self._setBinary()
+        return self._binary
+
+    @_isBinary.setter
+    def _isBinary(self, binary):
+        self._binary = binary
+
     def _setBinary(self):
         for y in self._y:
             if len(self._df[y].unique()) > 2:
@@ -130,26 +507,286 @@ class Data:
            :return: /
            """
         from sklearn.utils import shuffle
-        self._df = shuffle(self.df(weight=True), random_state=seed)
+        order = shuffle(np.arange(len(self)), random_state=seed)
+        self._df = self._df.take(order)
+        self._w = self._w[order]
+        self._select_groups(order)
 
     def head(self):
-        return self.df(weight=False).head()
+        return self._df.head()
+
+    def split(self, size, seed=None, stratify=False):
+        """
+           Splits the data into a train and test set. Both are views on the rows of this object, they share its
+           columns and keep its weights and groups
+
+           :size: fraction of the test set
+           :seed: seed to split with, if None, a random seed is used
+           :stratify: if True, every combination of group (privileged, unprivileged) and label has the same
+                      share in both sets
+           :return: train Data, test Data
+           """
+        train, test = train_test_split(np.arange(len(self)), test_size=size, random_state=seed,
+                                       stratify=self._strata() if stratify else None)
+        return self._take(train), self._take(test)
+
+    def kfold(self, k, seed=None, stratify=False, shuffle=True):
+        """
+           Iterates over k train/test splits in which every row is in exactly one test set. The sets are views on
+           the rows of this object, as in split
 
-    def split(self, size, seed=None):
-        train, test = train_test_split(self._df, test_size=size, random_state=seed)
-        return Data(train, protected_attributes=self._p, labels=self._y), Data(test, protected_attributes=self._p, labels=self._y),
+           :k: number of folds
+           :seed: seed to shuffle with, if None, a random seed is used
+           :stratify: if True, folds are stratified by group and label, as in split
+           :shuffle: if False, folds are consecutive rows
+           :return: generator of (train Data, test Data)
+           """
+        from sklearn.model_selection import KFold, StratifiedKFold
+        folds = (StratifiedKFold if stratify else KFold)(n_splits=k, shuffle=shuffle,
+                                                         random_state=seed if shuffle else None)
+        for train, test in folds.split(np.zeros(len(self)), self._strata() if stratify else None):
+            yield self._take(train), self._take(test)
+
+    def _strata(self):
+        # group x label, one integer per row
+        return self._group_codes().astype(np.int64) * 3 + _outcome_codes(self.y())
+
+    def train_test_split(self, size, seed=None, dtype=None):
+        """
+           Splits X and y into a train and test set
 
-    def train_test_split(self, size, seed=None):
-        X_train, X_test, Y_train, Y_test = train_test_split(self.X(), self.y(), test_size=size, random_state=seed)
+           :size: fraction of the test set
+           :seed: seed to split with, if None, a random seed is used
+           :dtype: if None, X is split as DataFrame, otherwise the cached feature matrix() of this type is split
+           """
+        X = self.X() if dtype is None else self.matrix(dtype)
+        X_train, X_test, Y_train, Y_test = train_test_split(X, self.y(), test_size=size, random_state=seed)
         return X_train, X_test, Y_train, Y_test
 
-def fromAif(data):
+    # storage
+    def save(self, path):
+        """
+           Saves the data to directory path: one .npy file per column, the weights, the index and a metadata.json
+           with the protected attributes, labels and groups. Categorical and text columns are stored as codes.
+
+           :path: directory, created if it doesn't exist
+           :return: /
+           """
+        os.makedirs(path, exist_ok=True)
+        columns = []
+        for i, name in enumerate(self._df.columns):
+            column = self._df[name]
+            categories = None
+            if column.dtype == object or isinstance(column.dtype, pd.CategoricalDtype):
+                column = column.astype("category")
+                categories = column.cat.categories.tolist()
+                column = column.cat.codes
+            np.save(os.path.join(path, f"{i}.npy"), column.to_numpy(), allow_pickle=False)
+            columns.append({"name": name, "categories": categories})
+        np.save(os.path.join(path, "weights.npy"), self._w, allow_pickle=False)
+
+        # a default index isn't stored, neither are text indices
+        index = self._df.index
+        has_index = not index.equals(pd.RangeIndex(len(index))) and index.dtype != object
+        if has_index:
+            np.save(os.path.join(path, "index.npy"), index.to_numpy(), allow_pickle=False)
+
+        def values(groups):
+            return {p: [v.item() if isinstance(v, np.generic) else v for v in groups[p]] for p in groups}
+        metadata = {"columns": columns, "index": has_index,
+                    "protected_attributes": self._p, "labels": self._y, "scores": self._scores,
+                    "privileged_groups": values(self._privileged_groups),
+                    "unprivileged_groups": values(self._unprivileged_groups), "binary": self._isBinary}
+        with open(os.path.join(path, "metadata.json"), "w") as f:
+            json.dump(metadata, f)
+
+    @staticmethod
+    def load(path, columns=None, mmap=True):
+        """
+           Loads data saved with save. With mmap the columns are memory mapped (read-only): loading doesn't read
+           the data, and processes loading the same data share it through the page cache. The columns are
+           copy-on-write as usual, modified columns are copied into memory.
+
+           :path: directory the data was saved to
+           :columns: columns to load, if None, all columns. Labels and protected attributes are always loaded
+           :mmap: if True, columns are memory mapped, otherwise they are read into memory
+           :return: Data
+           """
+        with open(os.path.join(path, "metadata.json")) as f:
+            metadata = json.load(f)
+        mode = "r" if mmap else None
+        keep = None if columns is None else set(columns) | set(metadata["labels"]) | set(metadata["protected_attributes"])
+
+        frame = dict()
+        for i, column in enumerate(metadata["columns"]):
+            if keep is not None and column["name"] not in keep:
+                continue
+            values = np.load(os.path.join(path, f"{i}.npy"), mmap_mode=mode)
+            if column["categories"] is not None:
+                values = pd.Categorical.from_codes(values, categories=column["categories"])
+            frame[column["name"]] = values
+        index = np.load(os.path.join(path, "index.npy"), mmap_mode=mode) if metadata["index"] else None
+        df = pd.DataFrame(frame, index=index, copy=False)
+
+        # groups and label type are restored from the metadata instead of being recomputed from the columns
+        d = Data(df, metadata["protected_attributes"], metadata["labels"],
+                 weights=np.load(os.path.join(path, "weights.npy"), mmap_mode=mode),
+                 scores=metadata["scores"] if metadata["scores"] in df else '', trusted=True,
+                 groups=(metadata["privileged_groups"], metadata["unprivileged_groups"]))
+        d._isBinary = metadata["binary"]
+        return d
+
+
+# metrics of fairness_report, measured per group
+DATASET_METRICS = ("num_instances", "num_positives", "num_negatives", "base_rate",
+                   "disparate_impact", "statistical_parity_difference", "mean_difference")
+CLASSIFICATION_METRICS = ("num_pred_positives", "num_pred_negatives", "selection_rate",
+                          "num_true_positives", "num_false_positives", "num_true_negatives", "num_false_negatives",
+                          "true_positive_rate", "false_positive_rate", "true_negative_rate", "false_negative_rate",
+                          "accuracy", "error_rate",
+                          "true_positive_rate_difference", "false_positive_rate_difference",
+                          "false_negative_rate_difference", "error_rate_difference", "equal_opportunity_difference",
+                          "average_odds_difference", "average_abs_odds_difference")
+
+# metrics comparing the unprivileged (u) and privileged (p) group, as in aif360 the group parity
+# metrics of a classification are computed on the predictions
+DATASET_DIFFERENCES = {
+    "disparate_impact": lambda u, p: u["base_rate"] / p["base_rate"],
+    "statistical_parity_difference": lambda u, p: u["base_rate"] - p["base_rate"],
+    "mean_difference": lambda u, p: u["base_rate"] - p["base_rate"],
+}
+CLASSIFICATION_DIFFERENCES = {
+    "disparate_impact": lambda u, p: u["selection_rate"] / p["selection_rate"],
+    "statistical_parity_difference": lambda u, p: u["selection_rate"] - p["selection_rate"],
+    "mean_difference": lambda u, p: u["selection_rate"] - p["selection_rate"],
+    "true_positive_rate_difference": lambda u, p: u["true_positive_rate"] - p["true_positive_rate"],
+    "false_positive_rate_difference": lambda u, p: u["false_positive_rate"] - p["false_positive_rate"],
+    "false_negative_rate_difference": lambda u, p: u["false_negative_rate"] - p["false_negative_rate"],
+    "error_rate_difference": lambda u, p: u["error_rate"] - p["error_rate"],
+    "equal_opportunity_difference": lambda u, p: u["true_positive_rate"] - p["true_positive_rate"],
+    "average_odds_difference": lambda u, p: 0.5 * ((u["false_positive_rate"] - p["false_positive_rate"])
+                                                   + (u["true_positive_rate"] - p["true_positive_rate"])),
+    "average_abs_odds_difference": lambda u, p: 0.5 * (abs(u["false_positive_rate"] - p["false_positive_rate"])
+                                                       + abs(u["true_positive_rate"] - p["true_positive_rate"])),
+}
+
+
+def _outcome_codes(values):
+    # 0: unfavorable (0), 1: favorable (1), 2: any other value
+    codes = np.full(len(values), 2, dtype=np.intp)
+    codes[values == 0] = 0
+    codes[values == 1] = 1
+    return codes
+
+
+def _measures(counts, predicted):
+    # counts[label, prediction] of one group, predicted holds the same counts with the weights of the predictions
+    n = counts.sum()
+    positives, negatives = counts[1].sum(), counts[0].sum()
+    tp, fp, tn, fn = counts[1, 1], counts[0, 1], counts[0, 0], counts[1, 0]
+    accuracy = (tp + tn) / (positives + negatives) if positives + negatives > 0 else np.float64(0.0)
+    return {
+        "num_instances": n, "num_positives": positives, "num_negatives": negatives, "base_rate": positives / n,
+        "num_pred_positives": predicted[:, 1].sum(), "num_pred_negatives": predicted[:, 0].sum(),
+        "selection_rate": predicted[:, 1].sum() / n,
+        "num_true_positives": tp, "num_false_positives": fp, "num_true_negatives": tn, "num_false_negatives": fn,
+        "true_positive_rate": tp / positives, "false_positive_rate": fp / negatives,
+        "true_negative_rate": tn / negatives, "false_negative_rate": fn / positives,
+        "accuracy": accuracy, "error_rate": 1 - accuracy,
+    }
+
+
+def fromAif(data, compact=True, exclude=None):
+    """
+       Converts an aif360 dataset to a Data object
+
+       :data: aif360 StructuredDataset
+       :compact: if True, integer valued columns are stored in the smallest fitting unsigned integer type
+       :exclude: columns that keep their original (float) type when compacting
+       :return: Data
+       """
     extracted_df = data.convert_to_dataframe()
     df = extracted_df[0]
     pa = extracted_df[1]["protected_attribute_names"]
     l  = extracted_df[1]["label_names"]
     w  = extracted_df[1]["instance_weights"]
-    return Data(df=df, protected_attributes=pa, labels=l, weights=w)
+    if compact:
+        df = compact_dtypes(df, exclude=exclude)
+    # the groups are taken from the values aif360 keeps per protected attribute instead of scanning the rows
+    values = {p: list(privileged) + list(unprivileged) for p, privileged, unprivileged in
+              zip(data.protected_attribute_names, data.privileged_protected_attributes,
+                  data.unprivileged_protected_attributes)}
+    return Data(df=df, protected_attributes=pa, labels=l, weights=w, trusted=True, groups=_groups(values))
+
+
+def concat(datas):
+    """
+       Concatenates Data objects with the same columns, protected attributes and labels. The groups are merged from
+       those of the parts instead of being recomputed from the rows
+
+       :datas: list of Data
+       :return: Data
+       """
+    first = datas[0]
+    values = {p: [v for d in datas for v in d._privileged_groups[p] + d._unprivileged_groups[p]] for p in first._p}
+    data = Data(pd.concat(d.df() for d in datas), first._p, first._y, weights=np.concatenate([d._w for d in datas]),
+                scores=first._scores, trusted=all(d._trusted for d in datas), groups=_groups(values))
+    if all(d._binary for d in datas):
+        data._binary = True
+    return data
+
+
+def _read_only(array):
+    # a view that can't be written, the array itself stays writable for its owner
+    view = array.view()
+    view.setflags(write=False)
+    return view
+
+
+def _version_of(other):
+    # cache version of results that depend on other: one slot per kind of result, the weak reference tells other
+    # apart from later objects without keeping it (and its predictions) alive
+    return () if other is None else (weakref.ref(other), other._version)
+
+
+def _fits(values, dtype):
+    # whether numeric values are stored in dtype without changing them (e.g. 0.7 or -1 in a compact uint8 label)
+    if values.dtype.kind not in "biuf" or dtype.kind not in "biuf":
+        return True
+    with np.errstate(invalid="ignore", over="ignore"):
+        return np.array_equal(values.astype(dtype), values, equal_nan=values.dtype.kind == "f" == dtype.kind)
+
+
+def _groups(values):
+    # the highest value of every protected attribute is privileged, its other values are unprivileged
+    # categoricals (named states) are compared by value, unordered categoricals have no max of their own
+    privileged, unprivileged = dict(), dict()
+    for p in values:
+        v = np.asarray(values[p])
+        privileged[p] = [np.max(v)]
+        unprivileged[p] = list(set(v) - set(privileged[p]))
+    return privileged, unprivileged
+
+
+def compact_dtypes(df, exclude=None):
+    """
+       Stores every column that only holds non-negative integer values in the smallest fitting unsigned integer type
+
+       :df: pandas DataFrame
+       :exclude: columns that keep their type
+       :return: DataFrame with compacted columns
+       """
+    if exclude is None:
+        exclude = []
+    types = dict()
+    for column in df.columns:
+        if column in exclude or column == "__weight__" or not pd.api.types.is_numeric_dtype(df[column]):
+            continue
+        values = df[column].to_numpy()
+        if len(values) == 0 or np.isnan(values.min()) or values.min() < 0 or np.any(values != np.floor(values)):
+            continue
+        types[column] = np.min_scalar_type(int(values.max()))
+    return df.astype(types)
 
 #
 #     def display(self):
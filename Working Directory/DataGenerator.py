@@ -1,4 +1,6 @@
-from Data import Data
+from Data import Data, concat
+import numpy as np
+import pandas as pd
 import pgmpy.models
 import BayesianNetwork
 from pgmpy.factors.discrete import TabularCPD
@@ -14,8 +16,121 @@ class DataGenerator:
         self._labels = labels
 
     # generates n items
-    def simulate(self, n=10, seed=None):
-        return Data(df=self.data_generator.simulate(n, seed=seed), protected_attributes=self._prot_attr, labels=self._labels)
+    # columns come in the smallest unsigned integer type for their cardinality, compact=False converts them to int64
+    # do, evidence and method are passed to BayesianNetwork.simulate, likelihood weights become the instance weights
+    def simulate(self, n=10, seed=None, n_jobs=1, compact=True, do=None, evidence=None, method="numpy"):
+        return self._data(self._simulate(n, seed, n_jobs, compact, do, evidence, method))
+
+    def _simulate(self, n, seed, n_jobs, compact, do, evidence, method):
+        # only options that differ from their defaults are passed, so plain pgmpy models keep working
+        options = {name: value for name, value, default in [("n_jobs", n_jobs, 1), ("do", do, None),
+                                                            ("evidence", evidence, None), ("method", method, "numpy")]
+                   if value != default}
+        df = self.data_generator.simulate(n, seed=seed, **options)
+        if not compact:
+            df = df.astype({c: np.int64 for c in df.columns if np.issubdtype(df[c].dtype, np.unsignedinteger)})
+        return df
+
+    # generates n items, chunk per chunk
+    def simulate_iter(self, n=10, chunk_size=100_000, seed=None, do=None, evidence=None, method="numpy"):
+        for df in self.data_generator.simulate_iter(n, chunk_size=chunk_size, seed=seed, do=do, evidence=evidence,
+                                                    method=method):
+            yield self._data(df)
+
+    # generates n items straight to a parquet or arrow ipc file
+    def simulate_to_file(self, path, n=10, chunk_size=100_000, seed=None, file_format="parquet"):
+        return write_chunks(self.simulate_iter(n, chunk_size=chunk_size, seed=seed), path, file_format=file_format)
+
+    # generates data until exactly n_target rows are left after applying the biases (in order, as one BiasPipeline)
+    # the batches are sized with the keep rate of the biases: the exact rate of the network when keep_rate knows it,
+    # otherwise the rate observed in the earlier batches. batch_size caps the rows simulated at once
+    def simulate_biased(self, n_target, biases, seed=None, batch_size=None, compact=True, do=None, evidence=None,
+                        method="numpy"):
+        from BiasGenerator.BiasPipeline import BiasPipeline
+
+        pipeline = BiasPipeline(biases)
+        rate = self.keep_rate(biases) if do is None and evidence is None else None
+        if rate == 0:
+            raise ValueError("the biases remove every row")
+        seeds = np.random.SeedSequence(seed)
+        parts, kept, generated = [], 0, 0
+        while kept < n_target:
+            remaining = n_target - kept
+            estimate = rate if rate is not None else kept / generated if generated else None
+            if estimate:
+                # a margin of 3 standard deviations, so most of the time one batch suffices
+                n = int(np.ceil((remaining + 3 * np.sqrt(remaining)) / estimate))
+            else:
+                n = max(remaining, 2 * generated)
+            if batch_size is not None:
+                n = min(n, batch_size)
+            batch_seed = int(seeds.spawn(1)[0].generate_state(1)[0])
+            df = self._simulate(n, batch_seed, 1, compact, do, evidence, method)
+            # rows are labeled by their position over all batches, as in simulate_iter
+            df.index += generated
+            data = pipeline.apply(self._data(df))
+            generated += n
+            if len(data) > remaining:
+                data = data.filter(np.arange(len(data)) < remaining)
+            if len(data):
+                parts.append(data)
+                kept += len(data)
+        return parts[0] if len(parts) == 1 else concat(parts)
+
+    def keep_rate(self, biases):
+        """
+        Exact expected share of the rows that is left after applying the biases, computed on the joint distribution
+        of the network. Known for (non exact) sampling biases and omitted values, measurement biases after the
+        last of these
+
+        :biases: list of bias generators
+        :return: float, or None if the rate can't be computed for these biases or this data generator
+        """
+        from BiasGenerator.SamplingBiasGenerator import SamplingBiasGenerator
+        from BiasGenerator.OmittedVariableBiasGenerator import OmittedVariableBiasGenerator
+        from BiasGenerator.MeasurementBiasGenerator import MeasurementBiasGenerator
+
+        if not hasattr(self.data_generator, "cube"):
+            return None
+        columns, measured = list(self._prot_attr) + list(self._labels), False
+        for bias in biases:
+            if isinstance(bias, MeasurementBiasGenerator):
+                measured = True
+                continue
+            if measured:
+                return None  # rows would be selected on measured values
+            if isinstance(bias, SamplingBiasGenerator) and not bias.exact:
+                columns += [bias.parameter] + [a for attributes in bias.weight for a in
+                                               (attributes if isinstance(attributes, tuple) else (attributes,))]
+            elif isinstance(bias, OmittedVariableBiasGenerator):
+                columns.append(bias.parameter_to_omit)
+            else:
+                return None
+        columns = list(dict.fromkeys(columns))
+
+        # every combination of values with a non zero probability is one row, weighted by its probability
+        try:
+            cube = self.data_generator.cube(columns)
+        except ValueError:
+            return None  # no exact inference for this network (e.g. wide logistic cpds)
+        cells = np.flatnonzero(cube.counts)
+        codes = np.unravel_index(cells, cube.counts.shape)
+        table = Data(pd.DataFrame({c: cube.values[i][codes[i]] for i, c in enumerate(columns)}),
+                     protected_attributes=self._prot_attr, labels=self._labels, weights=cube.counts.ravel()[cells])
+        keep = np.ones(len(table))
+        mask = np.ones(len(table), dtype=bool)
+        for bias in biases:
+            if isinstance(bias, SamplingBiasGenerator):
+                keep *= 1 - bias._probabilities(table)[0]
+            elif isinstance(bias, OmittedVariableBiasGenerator):
+                # None: the column is removed instead of rows
+                omitted = bias.keep(table, mask)
+                mask = mask if omitted is None else omitted
+        return float(np.sum(table._w * keep * mask) / np.sum(table._w))
+
+    def _data(self, df):
+        weights = df.pop("__weight__").to_numpy() if "__weight__" in df else None
+        return Data(df=df, protected_attributes=self._prot_attr, labels=self._labels, weights=weights, trusted=True)
 
 
 class BiasGenerator:
@@ -25,6 +140,47 @@ class BiasGenerator:
     def apply(self, data):
         return data
 
+    # generators that only remove rows, each row independently of the others, implement keep, so a BiasPipeline can
+    # combine them into one selection. mask holds the rows left by earlier generators, returns the rows left after
+    # this one, or None when this generator can't be expressed as a row selection for this data
+    def keep(self, data, mask):
+        return None
+
+
+def write_chunks(chunks, path, file_format="parquet"):
+    """
+    Writes a stream of Data objects (or DataFrames) to one file, chunk per chunk, including weights
+
+    :chunks: iterable of Data or pandas DataFrame objects with identical columns
+    :path: output file
+    :file_format: "parquet" or "arrow" (arrow ipc file)
+    :return: number of rows written
+    """
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.ipc
+
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, Data):
+                chunk = chunk.df(weight=True)
+            table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                if file_format == "parquet":
+                    writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+                elif file_format == "arrow":
+                    writer = pyarrow.ipc.new_file(path, table.schema)
+                else:
+                    raise ValueError(f"unknown file format: {file_format}")
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
 
 def sample_model():
     bn = BayesianNetwork.BayesianNetwork()
@@ -82,13 +238,12 @@ def police_model():
 
 def test_data(data):
     if "age" not in data.df():
-        df2 = data.df().groupby(['gender'], as_index=False)['income'].agg({"mean": "mean", "count": "count"})
+        df2 = data.cube(['gender', 'income']).summary(['gender'], 'income')
     elif "hard-working" not in data.df():
-        df2 = data.df().groupby(['gender', 'age'], as_index=False)['income'].agg({"mean": "mean", "count": "count"})
+        df2 = data.cube(['gender', 'age', 'income']).summary(['gender', 'age'], 'income')
         sns.barplot(x="age", hue="gender", y="mean", data=df2)
     else:
-        df2 = data.df().groupby(['gender', 'age', "hard-working"], as_index=False)['income'].agg(
-            {"mean": "mean", "count": "count"})
+        df2 = data.cube(['gender', 'age', "hard-working", 'income']).summary(['gender', 'age', "hard-working"], 'income')
         sns.catplot(x="age", y="mean", hue="gender", col="hard-working", data=df2, kind="bar")
     plt.show()
 
@@ -97,17 +252,16 @@ def test_data(data):
         plt.show()
 
 def test_data2(data):
-    df2 = data.df().groupby(['group', 'gender'], as_index=False)['income'].agg(
-        {"mean": "mean", "count": "count"})
+    cube = data.cube(['group', 'gender', 'income'])
+    df2 = cube.summary(['group', 'gender'], 'income')
     print(df2)
-    df3 = data.df().groupby(['gender'], as_index=False)['income'].agg(
-        {"mean": "mean", "count": "count"})
+    df3 = cube.summary(['gender'], 'income')
     print(df3)
 
 
 def test_police_data(data):
-    df2 = data.df().groupby(['gender', 'race', "searched", "drugs"], as_index=False)['drugs-detected'].agg(
-        {"mean": "mean", "count": "count"})
+    df2 = data.cube(['gender', 'race', "searched", "drugs", 'drugs-detected']).summary(
+        ['gender', 'race', "searched", "drugs"], 'drugs-detected')
     sns.catplot(x="drugs", y="count", hue="race", col="searched", data=df2, kind="bar")
     sns.catplot(x="drugs", y="mean", hue="race", col="searched", data=df2, kind="bar")
     plt.show()
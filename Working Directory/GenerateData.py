@@ -5,9 +5,8 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.svm import SVC
 from sklearn.metrics import accuracy_score
 from Data import Data
-import pickle
 
-def generate_base(size, features):
+def generate_base(size, features, n_jobs=-1):
     bn = BayesianNetwork()
     bn.addNode("Y")
     bn.addNode("A")
@@ -25,7 +24,7 @@ def generate_base(size, features):
         r2 = random.uniform(0.2, 0.8)
         bn.addProbability(f"X{i}", {"A": [r, 1-r], "Y":[r2, 1-r2]}, 2)
 
-    return Data(bn.simulate(size), protected_attributes=["A"], labels=["Y"])
+    return Data(bn.simulate(size, n_jobs=n_jobs), protected_attributes=["A"], labels=["Y"])
 
 
 if __name__ == "__main__":
@@ -41,20 +40,16 @@ if __name__ == "__main__":
 
 
     data = generate_base(100_000, 50)
-    with open("data/synthetic/50_x.p", "wb") as f:
-        pickle.dump(data, f)
+    data.save("data/synthetic/50_x")
     test(data, 50)
     data = generate_base(100_000, 20)
-    with open("data/synthetic/20_x.p", "wb") as f:
-        pickle.dump(data, f)
+    data.save("data/synthetic/20_x")
     test(data, 20)
     data = generate_base(100_000, 10)
-    with open("data/synthetic/10_x.p", "wb") as f:
-        pickle.dump(data, f)
+    data.save("data/synthetic/10_x")
     test(data, 10)
     data = generate_base(100_000, 5)
-    with open("data/synthetic/5_x.p", "wb") as f:
-        pickle.dump(data, f)
+    data.save("data/synthetic/5_x")
     test(data, 5)
 
 
@@ -0,0 +1,114 @@
+import numpy as np
+import scipy.special
+import pgmpy.factors.discrete
+
+
+class ParametricCPD:
+    """
+    Base class for cpds that are defined by a formula over the parent values instead of a table. The
+    full table has one column per parent configuration, which is exponential in the number of parents,
+    parametric cpds are evaluated per row instead, in O(n * #parents).
+
+    Attributes
+    ----------
+    variable : str
+        the node this cpd belongs to
+    variable_card : int
+        cardinality of the node
+    parents : list
+        the parents of the node, parent values are their value codes 0..cardinality-1
+
+    Methods
+    -------
+    probabilities(parent_values)
+        Returns an array of shape (variable_card, n) with the outcome probabilities for n parent configurations.
+    to_tabular(parent_cardinalities)
+        Materializes the full TabularCPD, exponential in the number of parents.
+    check(parent_cardinalities)
+        Raises a ValueError when the cpd is not valid.
+    """
+    def __init__(self, variable, variable_card, parents):
+        self.variable = variable
+        self.variable_card = variable_card
+        self.parents = list(parents)
+
+    def probabilities(self, parent_values):
+        raise NotImplementedError()
+
+    def to_tabular(self, parent_cardinalities):
+        # np.indices in C order lets the first parent vary slowest, as in pgmpy
+        configurations = np.indices(parent_cardinalities).reshape(len(self.parents), -1)
+        return pgmpy.factors.discrete.TabularCPD(self.variable, self.variable_card, self.probabilities(configurations),
+                                                 evidence=self.parents or None,
+                                                 evidence_card=list(parent_cardinalities) or None)
+
+    def check(self, parent_cardinalities):
+        if len(parent_cardinalities) != len(self.parents):
+            raise ValueError(f"cpd of {self.variable} expects {len(self.parents)} parent cardinalities")
+
+
+class LogisticCPD(ParametricCPD):
+    """
+    Softmax (for two values: logistic) model over a weighted sum of the parent values:
+    P(variable = v | parents = x) = softmax(intercept + weights @ x)[v]
+
+    Attributes
+    ----------
+    weights : np.ndarray
+        shape (variable_card, #parents). For a binary variable a vector of length #parents is accepted,
+        these are the weights of value 1 (value 0 has weight 0).
+    intercept : np.ndarray
+        shape (variable_card,). For a binary variable a scalar is accepted, the intercept of value 1.
+    """
+    def __init__(self, variable, parents, weights, intercept=0.0, variable_card=2):
+        super().__init__(variable, variable_card, parents)
+        weights = np.asarray(weights, dtype=float)
+        intercept = np.asarray(intercept, dtype=float)
+        if weights.ndim == 1:
+            weights = np.vstack([np.zeros_like(weights), weights])
+        if intercept.ndim == 0:
+            intercept = np.asarray([0.0, float(intercept)])
+        self.weights = weights
+        self.intercept = intercept
+
+    def probabilities(self, parent_values):
+        logits = self.intercept[:, None] + self.weights @ np.asarray(parent_values, dtype=float)
+        return scipy.special.softmax(logits, axis=0)
+
+    def check(self, parent_cardinalities):
+        super().check(parent_cardinalities)
+        if self.weights.shape != (self.variable_card, len(self.parents)):
+            raise ValueError(f"weights of {self.variable} should have shape {(self.variable_card, len(self.parents))}")
+        if self.intercept.shape != (self.variable_card,):
+            raise ValueError(f"intercept of {self.variable} should have length {self.variable_card}")
+
+
+class NoisyOrCPD(ParametricCPD):
+    """
+    Noisy-OR model for a binary variable: every parent with a non-zero value independently causes
+    variable = 1 with its own probability, the leak causes variable = 1 without any active parent.
+    P(variable = 1 | parents = x) = 1 - (1 - leak) * prod_j (1 - probabilities[j]) ** [x_j > 0]
+
+    Attributes
+    ----------
+    activation : np.ndarray
+        the probability for each parent to activate the variable
+    leak : float
+        probability of activation without an active parent
+    """
+    def __init__(self, variable, parents, probabilities, leak=0.0):
+        super().__init__(variable, 2, parents)
+        self.activation = np.asarray(probabilities, dtype=float)
+        self.leak = leak
+
+    def probabilities(self, parent_values):
+        active = np.asarray(parent_values) > 0
+        inactive = (1 - self.leak) * np.prod(np.where(active, 1 - self.activation[:, None], 1.0), axis=0)
+        return np.vstack([inactive, 1 - inactive])
+
+    def check(self, parent_cardinalities):
+        super().check(parent_cardinalities)
+        if self.activation.shape != (len(self.parents),):
+            raise ValueError(f"{self.variable} needs one activation probability per parent")
+        if np.any((self.activation < 0) | (self.activation > 1)) or not 0 <= self.leak <= 1:
+            raise ValueError(f"probabilities of {self.variable} should be within [0, 1]")
@@ -0,0 +1,36 @@
+import Bias
+
+if __name__ == "__main__":
+    model = Bias.sample_model()
+    bias = Bias.DataGenerator(data_generator=model, protected_attributes=["gender"], labels=["income"])
+
+    data = bias.simulate(100_000)
+    Bias.test_data(data)
+    print(data.metrics().disparate_impact())
+
+    print()
+    pipeline = Bias.BiasPipeline([
+        Bias.SamplingBiasGenerator(parameter="gender", parameter_value=0),
+        Bias.OmittedVariableBiasGenerator(parameter_to_omit="age", parameter_value=4),
+        Bias.OmittedVariableBiasGenerator(parameter_to_omit="age", parameter_value=3),
+        Bias.MeasurementBiasGenerator(parameter="gender", parameter_value=0, measurement="age", bias_strength=1),
+        Bias.MeasurementBiasGenerator(parameter="gender", parameter_value=1, measurement="age", weight={"invalid_ratio": 0.1}, bias_strength=1),
+        Bias.OmittedVariableBiasGenerator(parameter_to_omit="age", parameter_value=2),
+        Bias.OmittedVariableBiasGenerator(parameter_to_omit="age", parameter_value=1),
+        Bias.OmittedVariableBiasGenerator(parameter_to_omit="age", parameter_value=0),
+    ])
+    data = pipeline.apply(data)
+    print(len(data.df()))
+    Bias.test_data(data)
+    print(data.metrics().disparate_impact())
+
+    for stage, seconds in pipeline.timings:
+        print(f"{seconds:.4f}s", stage)
+
+    print()
+    biases = [Bias.SamplingBiasGenerator(parameter="gender", parameter_value=0),
+              Bias.OmittedVariableBiasGenerator(parameter_to_omit="age", parameter_value=4)]
+    print(bias.keep_rate(biases))
+    data = bias.simulate_biased(100_000, biases)
+    print(len(data.df()))
+    Bias.test_data(data)
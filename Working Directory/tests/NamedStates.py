@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from pgmpy.factors.discrete import TabularCPD
+
+import Bias
+from BayesianNetwork import BayesianNetwork
+
+if __name__ == "__main__":
+    # nodes with named states are simulated as categoricals
+    model = BayesianNetwork()
+    model.addEdge("gender", "income")
+    model._network.add_cpds(TabularCPD("gender", 2, [[0.5], [0.5]], state_names={"gender": ["female", "male"]}),
+                            TabularCPD("income", 2, [[0.7, 0.5], [0.3, 0.5]], evidence=["gender"], evidence_card=[2],
+                                       state_names={"income": [0, 1], "gender": ["female", "male"]}))
+    generator = Bias.DataGenerator(data_generator=model, protected_attributes=["gender"], labels=["income"])
+    data = generator.simulate(10_000, seed=0)
+    print(data.df().dtypes.to_dict())
+    print(data.privilegedGroups(), data.unprivilegedGroups())
+    assert data.privilegedGroups() == {"gender": ["male"]}
+    assert isinstance(data.df()["gender"].dtype, pd.CategoricalDtype)
+    report = data.fairness_report()
+    print(report["disparate_impact"], model.fairness_metrics("gender", "income")["disparate_impact"])
+    assert np.isclose(report["disparate_impact"], 0.6, atol=0.1)
+
+    # fitting on simulated data gives back the named states
+    fitted = BayesianNetwork().fit(data, structure=[("gender", "income")])
+    print(fitted.fairness_metrics("gender", "income")["disparate_impact"])
+    assert list(fitted.compile().state_names[fitted.compile().nodes.index("gender")]) == ["female", "male"]
+    assert len(Bias.DataGenerator(fitted, ["gender"], ["income"]).simulate(100)) == 100
@@ -38,3 +38,8 @@ if __name__ == "__main__":
 
 
 
+
+    bias = Bias.StreamingTemporalBiasGenerator(parameter="hyped_param", primary_distribution=var_mean, hype_distribution=var_meant, use_index_as_time=False, n=10_000)
+    for chunk in generator.simulate_iter(10_000, chunk_size=2_500):
+        chunk = bias.apply(chunk)
+        print(chunk.df()["time"].min(), chunk.df()["hyped_param"].mean())